@@ -0,0 +1,4 @@
+from __future__ import absolute_import
+
+# Makes sure the Celery app is loaded when Django starts, so that shared_task uses it
+from .celery import app as celery_app  # noqa
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'common.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +56,9 @@ MIDDLEWARE = [
     'social_django.middleware.SocialAuthExceptionMiddleware',
 ]
 
+# Share of the requests profiled by common.profiling.ProfilingMiddleware, from 0 (off) to 1 (all of them)
+REQUEST_PROFILING_SAMPLE_RATE = config('REQUEST_PROFILING_SAMPLE_RATE', default=0, cast=float)
+
 ROOT_URLCONF = 'VinTwitta.urls'
 
 TEMPLATES = [
@@ -127,23 +131,50 @@ WEBPACK_LOADER = {
     }
 }
 
-# Celery
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vintwitta',
+    }
+}
+
+# Tracked handles refresh, see tweet_monitor.tasks.refresh_tracked_handles. The budget is the number of
+# timeline calls (of up to 200 tweets each) the refreshes can make every interval, in seconds
+TWEET_REFRESH_INTERVAL = config('TWEET_REFRESH_INTERVAL', default=300, cast=int)
+TWEET_REFRESH_BUDGET = config('TWEET_REFRESH_BUDGET', default=50, cast=int)
+
+# Celery. The fetches of a bulk fetch run as one task per handle, so the workers' concurrency is how many
+# handles are fetched at once. Each task stores its handle's pages with batched inserts, the inserts of
+# different handles aren't merged (see tweet_monitor.views._schedule_batch)
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'refresh-tracked-handles': {
+        'task': 'tweet_monitor.tasks.refresh_tracked_handles',
+        'schedule': TWEET_REFRESH_INTERVAL,
+    },
+}
 
 # Django Rest Framework
-# REST_FRAMEWORK = {
-#     # Use Django's standard `django.contrib.auth` permissions,
-#     # or allow read-only access for unauthenticated users.
-#     'DEFAULT_PERMISSION_CLASSES': [
-#         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
-#     ]
-# }
+REST_FRAMEWORK = {
+    # Use Django's standard `django.contrib.auth` permissions,
+    # or allow read-only access for unauthenticated users.
+    # 'DEFAULT_PERMISSION_CLASSES': [
+    #     'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
+    # ]
+
+    # Default number of results per page of the list endpoints, can be changed with ?page_size=
+    'PAGE_SIZE': config('API_PAGE_SIZE', default=100, cast=int),
+}
 
 # Twitter
 SOCIAL_AUTH_TWITTER_KEY = "XIdVBdiKVSMj7NyoCO5xIzear"
 SOCIAL_AUTH_TWITTER_SECRET = "UXD4Pd09cYA4pHZDoh7J6ZNdCF120gaPYkCDHcYdqPb4ccMRgM"
+# The class used to call the Twitter API. tweet_monitor.fake_twitter.FakeTwitterAPI serves synthetic timelines,
+# configured by FAKE_TWITTER, to work without network access.
+TWITTER_API_BACKEND = config('TWITTER_API_BACKEND', default='tweet_monitor.clients.PooledAPI')
 
 LOGIN_URL = 'home'
 LOGOUT_URL = 'logout'
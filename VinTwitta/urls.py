@@ -3,6 +3,8 @@ from django.contrib import admin
 from django.contrib.auth import views as auth_views
 from django.views.generic import TemplateView
 
+from tweet_monitor.views import metrics
+
 app_name = "vintwitta"
 
 urlpatterns = [
@@ -14,4 +16,5 @@ urlpatterns = [
     url(r'^login/$', auth_views.login, name='login'),
     url(r'^logout/$', auth_views.logout, name='logout'),
     url(r'^oauth/', include('social_django.urls', namespace='social')),
+    url(r'^metrics$', metrics, name='metrics'),
 ]
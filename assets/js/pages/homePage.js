@@ -54,8 +54,8 @@ function FilterResults(props) {
       <h3>Tweets Filtered:</h3>
       <select name="filteredTweets" style={{ minWidth: "20%", maxWidth: "95%" }} size="10">
         {
-          props.results.data ?
-          props.results.data.map(function(result) {
+          props.results.results ?
+          props.results.results.map(function(result) {
             return <option key={result.provider_id} value={result.provider_id} style={{ padding: "6px" }}>
               @{result.owner} said: {result.text}
             </option>;
@@ -86,8 +86,8 @@ class FilterByUser extends React.Component {
     if (username != "" && username.length > 0) {
       axios.get('/tweets/filters/user/' + username + '/')
         .then(function (response) {
-          if (response.data && response.data.length > 0) {
-            self.setState({results: response});
+          if (response.data && response.data.results.length > 0) {
+            self.setState({results: response.data});
           } else {
             self.setState({error: "No tweets were found with this filtering criteria."});
           }
@@ -147,8 +147,8 @@ class FilterByDate extends React.Component {
     if (date != "" && date.length > 0) {
       axios.get('/tweets/filters/date/' + date + '/')
         .then(function (response) {
-          if (response.data && response.data.length > 0) {
-            self.setState({results: response});
+          if (response.data && response.data.results.length > 0) {
+            self.setState({results: response.data});
           } else {
             self.setState({error: "No tweets were found with this filtering criteria."});
           }
@@ -211,8 +211,8 @@ class FilterByText extends React.Component {
     if (text != "" && text.length > 0) {
       axios.get('/tweets/filters/text/' + text + '/')
         .then(function (response) {
-          if (response.data && response.data.length > 0) {
-            self.setState({results: response});
+          if (response.data && response.data.results.length > 0) {
+            self.setState({results: response.data});
           } else {
             self.setState({error: "No tweets were found with this filtering criteria."});
           }
@@ -272,8 +272,8 @@ class FilterByHashtag extends React.Component {
       hashtag = hashtag.replace("#", "");
       axios.get('/tweets/filters/hashtag/' + hashtag + '/')
         .then(function (response) {
-          if (response.data && response.data.length > 0) {
-            self.setState({results: response});
+          if (response.data && response.data.results.length > 0) {
+            self.setState({results: response.data});
           } else {
             self.setState({error: "No tweets were found with this filtering criteria."});
           }
@@ -293,12 +293,16 @@ class FilterByHashtag extends React.Component {
     this.setState({ hashtag: evt.target.value });
   }
 
-  componentDidMount() {
+  fetchHashtags(url, hashtags) {
+    // The hashtags list is paginated, so the pages are followed until there's no next one
     self = this;
-    axios.get('/tweets/list_hashtags/')
+    axios.get(url)
       .then(function (response) {
-        if (response.data && response.data.length > 0) {
-          self.setState({hashtagList: response})
+        hashtags = hashtags.concat(response.data ? response.data.results : []);
+        if (response.data && response.data.next) {
+          self.fetchHashtags(response.data.next, hashtags);
+        } else if (hashtags.length > 0) {
+          self.setState({hashtagList: {results: hashtags}});
         } else {
           self.setState({error: "No hashtags were found, please add more tweets to the database."});
         }
@@ -309,6 +313,10 @@ class FilterByHashtag extends React.Component {
     });
   }
 
+  componentDidMount() {
+    this.fetchHashtags('/tweets/list_hashtags/?page_size=1000', []);
+  }
+
   render() {
     return (
       <div>
@@ -319,8 +327,8 @@ class FilterByHashtag extends React.Component {
         <select onChange={(evt) => this.storeHashtag(evt)}>
           <option value="">---</option>
           {
-            this.state.hashtagList.data ?
-            this.state.hashtagList.data.map(function(hashtag, i) {
+            this.state.hashtagList.results ?
+            this.state.hashtagList.results.map(function(hashtag, i) {
               return <option key={i}
                 value={hashtag.name}>{hashtag.name}</option>;
             }) :
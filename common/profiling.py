@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class RequestProfile(object):
+    """ The time spent in each section of a request, in seconds. """
+
+    def __init__(self):
+        self.sections = OrderedDict()
+        self.depth = 0
+
+    def add(self, name, duration):
+        self.sections[name] = self.sections.get(name, 0) + duration
+
+
+def get_current_profile():
+    """ Returns the RequestProfile of the request being handled by this thread, if it's being profiled. """
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def profile_section(name):
+    """
+    Adds the time spent in the block to a section of the current request's profile. Nested blocks aren't
+    counted again, so it can wrap code that calls itself (e.g. nested serializers). Does nothing when the
+    request isn't being profiled.
+    :param name: The section name.
+    """
+    profile = get_current_profile()
+    if profile is None or profile.depth:
+        yield
+        return
+
+    profile.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - start)
+        profile.depth -= 1
+
+
+class ProfilingMiddleware(object):
+    """
+    Profiles a sample of the requests (settings.REQUEST_PROFILING_SAMPLE_RATE, from 0 to 1): the total
+    time, the time spent in the view (everything but rendering the response), the number of queries and
+    their time, and the time spent serializing (see profile_section) and rendering the response. The
+    numbers are sent in the Server-Timing header and logged with the request ID set by django-log-request-id.
+    The SQL is timed by Django's debug cursor, which is only turned on for the sampled requests.
+    It should be the first middleware after RequestIDMiddleware, so it renders the responses after every
+    other middleware changed them and its timings cover all of them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sample_rate = getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0)
+        if not sample_rate or random.random() >= sample_rate:
+            return self.get_response(request)
+
+        profile = _local.profile = RequestProfile()
+        debug_cursors = {}
+        for connection in connections.all():
+            debug_cursors[connection.alias] = connection.force_debug_cursor
+            connection.force_debug_cursor = True
+            connection.queries_log.clear()
+
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            _local.profile = None
+            query_count, query_time = 0, 0
+            for connection in connections.all():
+                query_count += len(connection.queries_log)
+                query_time += sum(float(query['time']) for query in connection.queries_log)
+                connection.force_debug_cursor = debug_cursors.get(connection.alias, False)
+
+        timings = OrderedDict([('total', total), ('view', total - profile.sections.get('render', 0)),
+                               ('db', query_time)])
+        timings.update(profile.sections)
+        response['Server-Timing'] = ', '.join(
+            '{};{}dur={:.1f}'.format(name, 'desc="{} queries";'.format(query_count) if name == 'db' else '',
+                                     duration * 1000)
+            for name, duration in timings.items())
+
+        logger.info("Profiled %s %s: %s", request.method, request.path, ' '.join(
+            ['status={}'.format(response.status_code), 'queries={}'.format(query_count)] +
+            ['{}_ms={:.1f}'.format(name, duration * 1000) for name, duration in timings.items()] +
+            ['request_id={}'.format(getattr(request, 'id', 'none'))]),
+            extra={'profile': dict(timings, queries=query_count, status=response.status_code)})
+        return response
+
+    def process_template_response(self, request, response):
+        # Rendering the DRF responses is the rest of their serialization
+        if get_current_profile() is not None:
+            with profile_section('render'):
+                response.render()
+        return response
@@ -1,5 +1,25 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
 
 class TweetMonitorConfig(AppConfig):
     name = 'tweet_monitor'
+
+    def ready(self):
+        from social_django.models import UserSocialAuth
+
+        from .cache import invalidate_saved_tweet
+        from .clients import invalidate_credentials
+        from .search import index_saved_tweet
+        from .trends import count_added_hashtags
+
+        post_save.connect(index_saved_tweet, sender=self.get_model('Tweet'),
+                          dispatch_uid='tweet_monitor_index_saved_tweet')
+        post_save.connect(invalidate_saved_tweet, sender=self.get_model('Tweet'),
+                          dispatch_uid='tweet_monitor_invalidate_saved_tweet')
+        m2m_changed.connect(count_added_hashtags, sender=self.get_model('Tweet').hashtags.through,
+                            dispatch_uid='tweet_monitor_count_added_hashtags')
+        post_save.connect(invalidate_credentials, sender=UserSocialAuth,
+                          dispatch_uid='tweet_monitor_invalidate_saved_credentials')
+        post_delete.connect(invalidate_credentials, sender=UserSocialAuth,
+                            dispatch_uid='tweet_monitor_invalidate_deleted_credentials')
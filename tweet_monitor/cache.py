@@ -0,0 +1,131 @@
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from rest_framework.response import Response
+
+
+# Cached responses don't need to expire, since they're invalidated by the ingestion, but they shouldn't
+# take memory forever either
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+HASHTAG_LIST_SCOPE = 'hashtags'
+
+# Marks the scope versions without a Last-Modified date
+UNDATED_SUFFIX = '-undated'
+
+
+def owner_scope(owner_key):
+    return 'owner:{}'.format(owner_key)
+
+
+def hashtag_scope(hashtag_key):
+    return 'hashtag:{}'.format(hashtag_key)
+
+
+def _version_key(scope):
+    return 'tweet_monitor:version:{}'.format(scope)
+
+
+def _new_version(previous=None):
+    """
+    Returns a new scope version. The timestamp tells when the scope last changed, and the random part avoids
+    clashes between processes.
+    :param previous: The version being replaced, if any. Last-Modified dates only have seconds, so when the
+    new version falls in the same second as it (or before, if the clocks differ), the date can't tell them
+    apart. The new version is then marked as undated, and only its ETag validates it.
+    """
+    timestamp = time.time()
+    undated = previous is not None and int(timestamp) <= int(float(previous.split('-', 1)[0]))
+    return '{:.6f}-{}{}'.format(timestamp, uuid.uuid4().hex[:8], UNDATED_SUFFIX if undated else '')
+
+
+def get_scope_version(scope):
+    """
+    Returns the current version of a scope, which changes whenever its data changes.
+    :param scope: The scope, e.g. owner_scope("lucabezerra_").
+    :return: A string.
+    """
+    version = cache.get(_version_key(scope))
+    if version is None:
+        # Unknown (or evicted) scopes start a new version, which is safe since nothing was cached under it
+        cache.add(_version_key(scope), _new_version(), None)
+        version = cache.get(_version_key(scope))
+    return version
+
+
+def get_version_time(version):
+    """
+    Returns when a scope version was created, which is when the scope's data last changed.
+    :param version: A version returned by get_scope_version.
+    :return: A timestamp, in whole seconds, or None if the version is undated (see _new_version).
+    """
+    if version.endswith(UNDATED_SUFFIX):
+        return None
+    return int(float(version.split('-', 1)[0]))
+
+
+def invalidate_scopes(scopes):
+    """
+    Makes the responses cached for the given scopes stale, by moving them to new versions.
+    :param scopes: An iterable of scopes.
+    """
+    keys = {_version_key(scope) for scope in scopes}
+    if keys:
+        versions = cache.get_many(keys)
+        cache.set_many({key: _new_version(versions.get(key)) for key in keys}, None)
+
+
+def invalidate_saved_tweet(sender, instance, raw=False, **kwargs):
+    """ Signal receiver invalidating the owner's responses when tweets are saved one by one. """
+    if not raw:
+        invalidate_scopes([owner_scope(instance.owner_key)])
+
+
+class CachedListMixin(object):
+    """
+    Caches the serialized responses of a list view. They're stored under the version of the view's scope,
+    so ingesting tweets for the scope (see invalidate_scopes) makes them stale, and the full URL, so every
+    page and set of parameters has its own entry.
+    The version also validates the responses for conditional requests: they're sent with an ETag and, unless
+    the version can't be told apart by its date, a Last-Modified date taken from it, and while it doesn't change, polling clients get a 304 Not Modified
+    without any query.
+    """
+
+    def get_cache_scope(self):
+        raise NotImplementedError("Views using CachedListMixin must define their cache scope.")
+
+    def get_cache_key(self, scope, version):
+        url_hash = hashlib.sha256(self.request.build_absolute_uri().encode('utf-8')).hexdigest()
+        return 'tweet_monitor:response:{}:{}:{}:{}'.format(self.__class__.__name__, scope, version, url_hash)
+
+    def get_etag(self, cache_key):
+        # Each format (e.g. JSON and the browsable API) is a different representation of the data
+        return hashlib.sha256('{}:{}'.format(cache_key, self.request.accepted_renderer.format)
+                              .encode('utf-8')).hexdigest()[:32]
+
+    def list(self, request, *args, **kwargs):
+        scope = self.get_cache_scope()
+        version = get_scope_version(scope)
+        cache_key = self.get_cache_key(scope, version)
+        etag, last_modified = self.get_etag(cache_key), get_version_time(version)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            data = cache.get(cache_key)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = super(CachedListMixin, self).list(request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(cache_key, response.data, RESPONSE_CACHE_TIMEOUT)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = quote_etag(etag)
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+import requests
+from social_django.models import UserSocialAuth
+import tweepy
+
+from .cache import get_scope_version, invalidate_scopes
+
+
+# How many users' API clients each process keeps
+API_CLIENT_CACHE_SIZE = 100
+
+# tweepy 3.5 makes a new requests session for every call, which would open a new connection (and go through
+# the TLS handshake) each time. They're all given this adapter, whose connection pool keeps them alive.
+HTTP_ADAPTER = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=20)
+
+
+def credentials_scope(user_id):
+    return 'credentials:{}'.format(user_id)
+
+
+class PooledAPI(tweepy.API):
+    """ tweepy.API whose calls reuse the keep-alive connections of HTTP_ADAPTER. """
+
+    @property
+    def user_timeline(self):
+        return self._pooled(super(PooledAPI, self).user_timeline)
+
+    @staticmethod
+    def _pooled(bound_method):
+        def call(*args, **kwargs):
+            # create=True builds the request without sending it, leaving a chance to swap the adapter
+            method = bound_method(*args, create=True, **kwargs)
+            method.session.params.pop('create', None)
+            method.session.mount('https://', HTTP_ADAPTER)
+            return method.execute()
+
+        call.pagination_mode = getattr(bound_method, 'pagination_mode', None)
+        return call
+
+
+def generate_tweepy_handler(user_access_token, user_access_token_secret):
+    """
+    Generate handler object to use Tweepy's methods.
+    :param user_access_token: The access token obtained from the signin process.
+    :param user_access_token_secret: The access token secret.
+    :return: The API handler.
+    """
+    consumer_key = settings.SOCIAL_AUTH_TWITTER_KEY
+    consumer_secret = settings.SOCIAL_AUTH_TWITTER_SECRET
+    access_key = user_access_token
+    access_secret = user_access_token_secret
+    auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
+    auth.set_access_token(access_key, access_secret)
+    handler = import_string(settings.TWITTER_API_BACKEND)(auth)
+
+    return handler
+
+
+class APIClientCache(object):
+    """
+    A process-local, least recently used cache of the users' API handlers, so repeated fetches skip reading
+    the credentials from the DB and building the handler. Each handler is kept with the version of its user's
+    credentials scope, which changes when they're saved (see invalidate_credentials), so handlers built with
+    old tokens are replaced in every process.
+    """
+
+    def __init__(self, max_size=API_CLIENT_CACHE_SIZE):
+        self.max_size = max_size
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Returns the API handler of a user, building it if needed.
+        :param user_id: The ID of the user whose Twitter credentials will be used.
+        :return: The API handler.
+        """
+        version = get_scope_version(credentials_scope(user_id))
+        with self._lock:
+            cached = self._clients.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._clients.move_to_end(user_id)
+                return cached[1]
+
+        user_obj = UserSocialAuth.objects.get(user_id=user_id)
+        client = generate_tweepy_handler(user_obj.extra_data['access_token']['oauth_token'],
+                                         user_obj.extra_data['access_token']['oauth_token_secret'])
+
+        with self._lock:
+            self._clients[user_id] = (version, client)
+            self._clients.move_to_end(user_id)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+api_clients = APIClientCache()
+
+
+def invalidate_credentials(sender, instance, raw=False, **kwargs):
+    """ Signal receiver making the cached API handlers of a user stale when their credentials change. """
+    if not raw:
+        invalidate_scopes([credentials_scope(instance.user_id)])
@@ -0,0 +1,82 @@
+import csv
+import json
+
+from rest_framework import serializers
+
+from .serializers import get_hashtag_names
+from .utils import LOOKUP_BATCH_SIZE
+
+
+EXPORT_FIELDS = ('provider_id', 'text', 'owner', 'creation_date', 'hashtags')
+
+# Rows read per query. Only one chunk is held in memory at a time.
+EXPORT_CHUNK_SIZE = LOOKUP_BATCH_SIZE
+
+
+def iter_tweet_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Reads the tweets of a queryset in chunks walking the primary key, so each chunk is an indexed range
+    scan that starts right where the previous one ended, and the hashtags of a chunk are read in one query.
+    :param queryset: The Tweet queryset, possibly filtered.
+    :param chunk_size: The number of tweets read per query.
+    :return: A generator of dicts with the tweet fields and the list of hashtag names.
+    """
+    queryset = queryset.order_by('id').values('id', 'provider_id', 'text', 'owner', 'creation_date')
+    last_id = None
+
+    while True:
+        chunk = queryset.filter(id__gt=last_id) if last_id is not None else queryset
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+
+        hashtags = get_hashtag_names([row['id'] for row in rows])
+        for row in rows:
+            row['hashtags'] = hashtags.get(row['id'], [])
+            yield row
+
+        last_id = rows[-1]['id']
+
+
+class Echo(object):
+    """ A file-like object that returns what is written to it, so csv.writer can produce single lines. """
+
+    def write(self, value):
+        return value
+
+
+def render_ndjson(rows):
+    """
+    Renders tweet rows as newline delimited JSON, with the same fields and formats as the API.
+    :param rows: Dicts from iter_tweet_rows.
+    :return: A generator of lines.
+    """
+    date_field = serializers.DateTimeField()
+    for row in rows:
+        yield json.dumps({
+            'provider_id': row['provider_id'],
+            'text': row['text'],
+            'owner': row['owner'],
+            'creation_date': date_field.to_representation(row['creation_date']),
+            'hashtags': [{'name': name} for name in row['hashtags']],
+        }, ensure_ascii=False) + '\n'
+
+
+def render_csv(rows):
+    """
+    Renders tweet rows as CSV with a header line. The hashtags are separated by spaces.
+    :param rows: Dicts from iter_tweet_rows.
+    :return: A generator of lines.
+    """
+    date_field = serializers.DateTimeField()
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([row['provider_id'], row['text'], row['owner'],
+                               date_field.to_representation(row['creation_date']), ' '.join(row['hashtags'])])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (render_ndjson, 'application/x-ndjson'),
+    'csv': (render_csv, 'text/csv'),
+}
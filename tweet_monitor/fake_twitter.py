@@ -0,0 +1,112 @@
+import datetime
+import random
+import time
+from types import SimpleNamespace
+import zlib
+
+from django.conf import settings
+
+from tweepy import TweepError
+
+
+# Can be changed with settings.FAKE_TWITTER, or per instance
+DEFAULT_OPTIONS = {
+    'TIMELINE_SIZE': 3200,  # tweets of each handle
+    'HASHTAG_DENSITY': 1.0,  # average hashtags per tweet
+    'HASHTAG_VOCABULARY': 1000,  # distinct hashtags, the first ones being the most used
+    'LATENCY': 0.0,  # seconds taken by each call
+    'ERROR_RATE': 0.0,  # share of the calls failing with a server error or a 429
+    'TWEET_INTERVAL': 3600,  # seconds between the tweets of a handle
+    'SEED': 0,
+}
+
+RATE_LIMIT = 900
+
+# Handles containing these words fail like missing or protected accounts
+NOT_FOUND_MARK = 'notfound'
+PROTECTED_MARK = 'protected'
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeTwitterAPI(object):
+    """
+    A local stand-in for tweepy.API, selected with settings.TWITTER_API_BACKEND, which serves synthetic
+    timelines without any network access. Every handle has TIMELINE_SIZE tweets, generated on demand and always
+    the same, with sequential IDs, so paging with since_id/max_id behaves like the real API.
+    """
+
+    def __init__(self, auth=None, **options):
+        self.auth = auth
+        self.options = dict(DEFAULT_OPTIONS, **getattr(settings, 'FAKE_TWITTER', {}))
+        self.options.update(options)
+        self.random = random.Random(self.options['SEED'])
+        self.last_response = None
+        self.remaining = RATE_LIMIT
+        self.newest_at = datetime.datetime.utcnow().replace(microsecond=0)
+
+    def user_timeline(self, screen_name, count=20, since_id=None, max_id=None, **kwargs):
+        if self.options['LATENCY']:
+            time.sleep(self.options['LATENCY'])
+
+        reset = int(time.time()) + 1
+        self.remaining = max(self.remaining - 1, 0)
+        headers = {'x-rate-limit-remaining': str(self.remaining), 'x-rate-limit-reset': str(reset)}
+        self._raise_error(screen_name, headers)
+        self.last_response = FakeResponse(200, headers)
+
+        first_id = self.first_id(screen_name)
+        newest_id = first_id + self.options['TIMELINE_SIZE'] - 1
+        if max_id is not None:
+            newest_id = min(newest_id, int(max_id))
+        oldest_id = max(first_id, int(since_id) + 1 if since_id else first_id, newest_id - int(count) + 1)
+
+        return [self.status(screen_name, tweet_id) for tweet_id in range(newest_id, oldest_id - 1, -1)]
+
+    def _raise_error(self, screen_name, headers):
+        status_code = None
+        if NOT_FOUND_MARK in screen_name.lower():
+            status_code = 404
+        elif PROTECTED_MARK in screen_name.lower():
+            status_code = 401
+        elif self.random.random() < self.options['ERROR_RATE']:
+            status_code = self.random.choice([429, 500, 503])
+
+        if status_code is not None:
+            self.last_response = FakeResponse(status_code, dict(headers, **{'x-rate-limit-remaining': '0'})
+                                              if status_code == 429 else headers)
+            raise TweepError("Fake error {}".format(status_code), response=self.last_response)
+
+    @staticmethod
+    def first_id(screen_name):
+        # Each handle gets its own range of IDs, far enough from the others'
+        return (zlib.crc32(screen_name.lower().encode('utf-8')) % 10 ** 8 + 1) * 10 ** 6
+
+    def status(self, screen_name, tweet_id):
+        """
+        Builds a tweet of a handle, mimicking the tweepy Status objects.
+        :param screen_name: The handle.
+        :param tweet_id: The tweet ID.
+        :return: An object with the id, text, user.screen_name and created_at attributes.
+        """
+        index = tweet_id - self.first_id(screen_name)
+        tweet_random = random.Random(tweet_id)
+
+        density = self.options['HASHTAG_DENSITY']
+        hashtag_count = int(density) + (tweet_random.random() < density - int(density))
+        hashtags = ['#tag{}'.format(int(tweet_random.paretovariate(1)) % self.options['HASHTAG_VOCABULARY'])
+                    for _ in range(hashtag_count)]
+
+        text = "Synthetic tweet number {} from {}".format(index, screen_name)
+        for hashtag in hashtags:
+            if len(text) + len(hashtag) + 1 > 140:
+                break
+            text += " " + hashtag
+
+        age = (self.options['TIMELINE_SIZE'] - 1 - index) * self.options['TWEET_INTERVAL']
+        return SimpleNamespace(id=tweet_id, text=text, user=SimpleNamespace(screen_name=screen_name),
+                               created_at=self.newest_at - datetime.timedelta(seconds=age))
@@ -0,0 +1,196 @@
+import datetime
+
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from rest_framework.exceptions import ValidationError
+
+from .models import HashtagDailyCount, TrackedHandle, Tweet, normalize_handle, normalize_hashtag
+from .search import count_term_matches, match_tweets, matching_tweet_ids, uses_token_index
+from .trends import usage_day
+
+
+FILTER_PARAMS = ('user', 'start', 'end', 'text', 'hashtag')
+
+
+def parse_date_param(name, value, end=False):
+    """
+    Parses a date or datetime request parameter into an aware datetime.
+    :param name: The parameter name, used in the error message.
+    :param value: The parameter value, e.g. "2017-06-01" or "2017-06-01T10:00:00-03:00".
+    :param end: If True, a date without time means the end of that day, i.e. the start of the next one.
+    :return: The datetime.
+    """
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is not None:
+                parsed = datetime.datetime.combine(day + datetime.timedelta(days=int(end)), datetime.time())
+    except ValueError:
+        parsed = None
+
+    if parsed is None:
+        raise ValidationError({name: "Invalid date, use the YYYY-MM-DD or ISO 8601 formats."})
+
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def parse_int_param(params, name, default, maximum):
+    """
+    Reads a positive integer request parameter.
+    :param params: A dict-like with the request parameters.
+    :param name: The parameter name.
+    :param default: The value used when the parameter isn't given.
+    :param maximum: The highest value accepted.
+    :return: The integer.
+    """
+    value = params.get(name, '').strip()
+    if not value:
+        return default
+
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if not 0 < number <= maximum:
+        raise ValidationError({name: "Must be an integer between 1 and {}.".format(maximum)})
+
+    return number
+
+
+def parse_fields_param(params, allowed, name='fields'):
+    """
+    Reads a comma separated list of the fields to be returned.
+    :param params: A dict-like with the request parameters.
+    :param allowed: The fields that can be asked for, in the order they're returned.
+    :param name: The parameter name.
+    :return: A tuple with the fields asked for, or all the allowed ones if the parameter isn't given.
+    """
+    fields = {field.strip() for field in params.get(name, '').split(',') if field.strip()}
+    if not fields:
+        return tuple(allowed)
+
+    unknown = fields.difference(allowed)
+    if unknown:
+        raise ValidationError({name: "Unknown fields: {}. Choose from: {}.".format(
+            ', '.join(sorted(unknown)), ', '.join(allowed))})
+
+    return tuple(field for field in allowed if field in fields)
+
+
+def get_tweet_filters(params):
+    """
+    Reads the tweet filters from request parameters.
+    :param params: A dict-like with any of the FILTER_PARAMS.
+    :return: A dict with the filters that were given, ready to be passed to filter_tweets.
+    """
+    filters = {name: params[name].strip() for name in FILTER_PARAMS if params.get(name, '').strip()}
+
+    if 'start' in filters:
+        filters['start'] = parse_date_param('start', filters['start'])
+    if 'end' in filters:
+        filters['end'] = parse_date_param('end', filters['end'], end=True)
+    if 'start' in filters and 'end' in filters and filters['start'] >= filters['end']:
+        raise ValidationError({'end': "Must be after the start."})
+
+    return filters
+
+
+def filter_tweets(queryset, user=None, start=None, end=None, text=None, hashtag=None):
+    """
+    Restricts a tweets queryset to the ones matching every given filter.
+    :param queryset: The Tweet queryset.
+    :param user: A Twitter handle.
+    :param start: The datetime the tweets were created at or after.
+    :param end: The datetime the tweets were created before.
+    :param text: Words the tweets must contain.
+    :param hashtag: A hashtag the tweets must have.
+    :return: The filtered queryset.
+    """
+    if user:
+        queryset = queryset.filter(owner_key=normalize_handle(user))
+    if start:
+        queryset = queryset.filter(creation_date__gte=start)
+    if end:
+        queryset = queryset.filter(creation_date__lt=end)
+    if hashtag:
+        queryset = queryset.filter(hashtags__key=normalize_hashtag(hashtag))
+    if text:
+        queryset = match_tweets(queryset, text)
+
+    return queryset
+
+
+def plan_tweet_filters(filters):
+    """
+    Estimates how many tweets each filter matches, from the counts kept by the ingestion, and orders them from
+    the most to the least selective. Filters that can't be estimated (date ranges, and texts on PostgreSQL)
+    come last.
+    :param filters: A dict from get_tweet_filters.
+    :return: A list of (filter, estimated number of tweets) tuples, or None if a filter is known to match
+    no tweets, in which case there's nothing to query.
+    """
+    # The filters that can rule out every tweet are estimated first
+    estimates = []
+
+    if 'hashtag' in filters:
+        daily_counts = HashtagDailyCount.objects.filter(hashtag__key=normalize_hashtag(filters['hashtag']))
+        if 'start' in filters:
+            daily_counts = daily_counts.filter(day__gte=usage_day(filters['start']))
+        if 'end' in filters:
+            daily_counts = daily_counts.filter(day__lte=usage_day(filters['end']))
+        uses = daily_counts.aggregate(uses=Sum('count'))['uses']
+        if not uses:
+            return None
+        estimates.append(('hashtag', uses))
+
+    if 'text' in filters:
+        term_counts = count_term_matches(filters['text'])
+        if term_counts is not None and (not term_counts or not min(term_counts.values())):
+            return None
+        estimates.append(('text', min(term_counts.values()) if term_counts else None))
+
+    if 'user' in filters:
+        tweet_count = TrackedHandle.objects.filter(key=normalize_handle(filters['user'])).values_list(
+            'tweet_count', flat=True).first()
+        # Tweets saved outside the ingestion aren't counted, so an unknown handle may still have tweets
+        estimates.append(('user', tweet_count or None))
+
+    if 'start' in filters or 'end' in filters:
+        estimates.append(('date', None))
+
+    return sorted(estimates, key=lambda estimate: (estimate[1] is None, estimate[1] or 0))
+
+
+def planned_filter_tweets(queryset, filters):
+    """
+    Restricts a tweets queryset like filter_tweets, but following plan_tweet_filters: the most selective filter
+    is applied first, as a subquery over its own index when it's a hashtag or text, so the database starts
+    from the smallest set of tweets and checks the other filters on it, still in a single query.
+    :param queryset: The Tweet queryset.
+    :param filters: A dict from get_tweet_filters.
+    :return: The filtered queryset.
+    """
+    plan = plan_tweet_filters(filters)
+    if plan is None:
+        return queryset.none()
+
+    for position, (name, _) in enumerate(plan):
+        leading = position == 0
+        if name == 'user':
+            queryset = queryset.filter(owner_key=normalize_handle(filters['user']))
+        elif name == 'date':
+            queryset = filter_tweets(queryset, start=filters.get('start'), end=filters.get('end'))
+        elif name == 'hashtag' and leading:
+            queryset = queryset.filter(id__in=Tweet.hashtags.through.objects.filter(
+                hashtag__key=normalize_hashtag(filters['hashtag'])).values('tweet_id'))
+        elif name == 'hashtag':
+            queryset = queryset.filter(hashtags__key=normalize_hashtag(filters['hashtag']))
+        elif name == 'text' and leading and uses_token_index():
+            queryset = queryset.filter(id__in=matching_tweet_ids(filters['text']))
+        else:
+            queryset = match_tweets(queryset, filters['text'])
+
+    return queryset
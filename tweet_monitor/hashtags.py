@@ -0,0 +1,55 @@
+import re
+
+
+# Combining marks, which the `re` module doesn't count as word characters but are part of words in many
+# scripts (accents written separately, and the vowel signs of the Indic and Southeast Asian scripts)
+_MARKS = (
+    '\u0300-\u036f\u0483-\u0489\u0591-\u05c7\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed'
+    '\u0900-\u0903\u093a-\u094f\u0951-\u0957\u0962\u0963\u0981-\u0983\u09bc-\u09d7'
+    '\u0a01-\u0a03\u0a3c-\u0a51\u0a81-\u0a83\u0abc-\u0acd\u0b01-\u0b03\u0b3c-\u0b57'
+    '\u0b82\u0bbe-\u0bcd\u0c00-\u0c04\u0c3e-\u0c56\u0c81-\u0c83\u0cbc-\u0cd6\u0d00-\u0d03'
+    '\u0d3e-\u0d57\u0e31\u0e34-\u0e3a\u0e47-\u0e4e\u0eb1\u0eb4-\u0ebc\u0ec8-\u0ecd'
+    '\u1ab0-\u1aff\u1dc0-\u1dff\u200c\u200d\u20d0-\u20f0\u3099\u309a\ufe20-\ufe2f'
+)
+_TAG_CHAR = r'[\w' + _MARKS + ']'
+
+# Follows Twitter's rules (see twitter-text): a hash, or a fullwidth one, not preceded by a word character
+# or "&" (as in URL fragments and HTML entities), then word characters with at least one that isn't a digit
+# or underscore. A hashtag can't be directly followed by another hash or by "://". The last lookahead also
+# keeps the match from stopping in the middle of a word, since `re` backtracks.
+HASHTAG_RE = re.compile(
+    r'(?<![&\w' + _MARKS + r'])[#\uff03](?![\ufe0f\u20e3])'
+    r'(?=' + _TAG_CHAR + r'*[^\W\d_])(' + _TAG_CHAR + r'+)'
+    r'(?!' + _TAG_CHAR + r'|[#\uff03]|://)',
+    re.UNICODE)
+
+
+def extract_hashtags(text):
+    """
+    Extracts the hashtags from a tweet text, leaving out surrounding punctuation.
+    :param text: The tweet text.
+    :return: A list with the hashtags (with a "#"), in the order they appear.
+    """
+    return ['#' + tag for tag in HASHTAG_RE.findall(text)]
+
+
+def extract_hashtags_batch(texts):
+    """
+    Extracts the hashtags from many tweet texts at once, going through them with the same compiled pattern.
+    :param texts: An iterable of tweet texts.
+    :return: A list with the hashtags of each text, like extract_hashtags returns them, in the same order.
+    """
+    findall = HASHTAG_RE.findall
+    return [['#' + tag for tag in findall(text)] for text in texts]
+
+
+def status_hashtags(status):
+    """
+    Returns the hashtags of a status as parsed by Twitter, when the API includes its entities.
+    :param status: A tweepy Status object.
+    :return: A list with the hashtags (with a "#"), or None if the status has no entities.
+    """
+    entities = getattr(status, 'entities', None)
+    if not isinstance(entities, dict) or 'hashtags' not in entities:
+        return None
+    return ['#' + hashtag['text'] for hashtag in entities['hashtags']]
@@ -0,0 +1,91 @@
+import datetime
+
+from django.db.models import Count, DateTimeField
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from rest_framework.exceptions import ValidationError
+
+
+HISTOGRAM_INTERVALS = {
+    'hour': datetime.timedelta(hours=1),
+    'day': datetime.timedelta(days=1),
+    'week': datetime.timedelta(weeks=1),
+}
+
+# The span covered when no start is given, in buckets
+HISTOGRAM_DEFAULT_BUCKETS = {'hour': 48, 'day': 30, 'week': 26}
+
+HISTOGRAM_MAX_BUCKETS = 1000
+
+
+def get_histogram_range(interval, start=None, end=None):
+    """
+    Completes and validates the range of a histogram.
+    :param interval: One of HISTOGRAM_INTERVALS.
+    :param start: The start datetime, by default a few buckets (see HISTOGRAM_DEFAULT_BUCKETS) before the end.
+    :param end: The end datetime, now by default.
+    :return: A tuple with the start and end datetimes.
+    """
+    if interval not in HISTOGRAM_INTERVALS:
+        raise ValidationError({'interval': "Must be one of: {}.".format(', '.join(sorted(HISTOGRAM_INTERVALS)))})
+
+    end = end or timezone.now()
+    start = start or end - HISTOGRAM_INTERVALS[interval] * HISTOGRAM_DEFAULT_BUCKETS[interval]
+    if (end - start) / HISTOGRAM_INTERVALS[interval] > HISTOGRAM_MAX_BUCKETS:
+        raise ValidationError({'start': "The range can't have more than {} buckets of a {}.".format(
+            HISTOGRAM_MAX_BUCKETS, interval)})
+
+    return start, end
+
+
+def bucket_start(value, interval):
+    """
+    Returns the start of the bucket a datetime falls in, in the current time zone. Weeks start on Mondays.
+    :param value: An aware datetime.
+    :param interval: One of HISTOGRAM_INTERVALS.
+    :return: An aware datetime.
+    """
+    local = timezone.localtime(value).replace(tzinfo=None)
+    if interval == 'hour':
+        local = local.replace(minute=0, second=0, microsecond=0)
+    else:
+        local = datetime.datetime.combine(local.date(), datetime.time())
+        if interval == 'week':
+            local -= datetime.timedelta(days=local.weekday())
+    return timezone.make_aware(local)
+
+
+def next_bucket(period, interval):
+    if interval == 'hour':
+        return period + HISTOGRAM_INTERVALS[interval]
+    # Days and weeks are stepped in local time, so they stay aligned to midnight across DST changes
+    return timezone.make_aware(timezone.localtime(period).replace(tzinfo=None) + HISTOGRAM_INTERVALS[interval])
+
+
+def tweet_histogram(queryset, interval, start, end):
+    """
+    Counts the tweets of a queryset per hour, day or week. The counting is done by the database, grouping by
+    the truncated creation date, so only one row per bucket is read. Weeks are added up from the days, since
+    the database functions available can't truncate to weeks.
+    :param queryset: The Tweet queryset, already restricted to the range.
+    :param interval: One of HISTOGRAM_INTERVALS.
+    :param start: The start datetime of the range.
+    :param end: The end datetime of the range (exclusive).
+    :return: A list of dicts with the period (the bucket start) and count, including the empty buckets.
+    """
+    kind = 'hour' if interval == 'hour' else 'day'
+    rows = (queryset.annotate(period=Trunc('creation_date', kind, output_field=DateTimeField()))
+            .order_by().values('period').annotate(count=Count('id')).values_list('period', 'count'))
+
+    counts = {}
+    for period, count in rows:
+        period = bucket_start(period, interval)
+        counts[period] = counts.get(period, 0) + count
+
+    buckets = []
+    period = bucket_start(start, interval)
+    while period < end:
+        buckets.append({'period': period, 'count': counts.get(period, 0)})
+        period = next_bucket(period, interval)
+    return buckets
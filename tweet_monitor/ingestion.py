@@ -0,0 +1,268 @@
+from collections import namedtuple, OrderedDict
+
+from django.db import IntegrityError, transaction
+
+from tweepy import TweepError
+
+from .cache import HASHTAG_LIST_SCOPE, hashtag_scope, invalidate_scopes, owner_scope
+from .hashtags import extract_hashtags_batch, status_hashtags
+from .metrics import HASHTAG_LINKS, TWEETS_INGESTED, TWEETS_SKIPPED, WRITE_BATCH_SIZE
+from .models import FetchJob, Hashtag, TrackedHandle, Tweet, normalize_handle, normalize_hashtag
+from .ratelimit import RateLimited, ScheduledAPI
+from .search import index_tweets
+from .trends import count_hashtag_uses
+from .utils import LOOKUP_BATCH_SIZE, chunked
+
+
+StoredStatuses = namedtuple('StoredStatuses', ['tweets', 'skipped'])
+
+# user_timeline returns at most 200 tweets per call and only the 3200 most recent ones overall
+TIMELINE_PAGE_SIZE = 200
+TIMELINE_MAX_PAGES = 3200 // TIMELINE_PAGE_SIZE
+
+
+def link_hashtags(tweets, known_hashtags=None):
+    """
+    Creates the hashtags found in the given tweets and links them, using a fixed number of queries
+    no matter how many tweets or hashtags there are.
+    :param tweets: Saved Tweet objects (they must have a primary key, provider ID and creation date).
+    :param known_hashtags: The hashtags of some of the tweets, as parsed by Twitter, by provider ID. The
+    hashtags of the other tweets are extracted from their texts.
+    :return: The number of tweet-hashtag links created.
+    """
+    hashtags = dict(known_hashtags or {})
+    unknown = [tweet for tweet in tweets if tweet.provider_id not in hashtags]
+    hashtags.update(zip((tweet.provider_id for tweet in unknown),
+                        extract_hashtags_batch(tweet.text for tweet in unknown)))
+
+    names = {}
+    keys_by_tweet = {}
+    creation_dates = {}
+    for tweet in tweets:
+        creation_dates[tweet.pk] = tweet.creation_date
+        for name in hashtags[tweet.provider_id]:
+            # The first spelling found is the one displayed
+            names.setdefault(normalize_hashtag(name), name)
+            keys_by_tweet.setdefault(tweet.pk, set()).add(normalize_hashtag(name))
+    if not names:
+        return 0
+
+    hashtag_ids = _get_hashtag_ids(sorted(names))
+    missing = [key for key in sorted(names) if key not in hashtag_ids]
+    if missing:
+        _create_hashtags([Hashtag(key=key, name=names[key]) for key in missing])
+        # bulk_create doesn't set primary keys on every backend, so they're read back
+        hashtag_ids.update(_get_hashtag_ids(missing))
+
+    through_model = Tweet.hashtags.through
+    links = [through_model(tweet_id=tweet_id, hashtag_id=hashtag_ids[key])
+             for tweet_id, keys in keys_by_tweet.items() for key in keys]
+    through_model.objects.bulk_create(links, batch_size=LOOKUP_BATCH_SIZE)
+    HASHTAG_LINKS.inc(len(links))
+    WRITE_BATCH_SIZE.observe(len(links), 'hashtag_links')
+    count_hashtag_uses((link.hashtag_id, creation_dates[link.tweet_id]) for link in links)
+
+    invalidate_scopes([hashtag_scope(key) for key in names] + ([HASHTAG_LIST_SCOPE] if missing else []))
+
+    return len(links)
+
+
+def _get_hashtag_ids(keys):
+    hashtag_ids = {}
+    for batch in chunked(keys):
+        hashtag_ids.update(Hashtag.objects.filter(key__in=batch).values_list('key', 'id'))
+    return hashtag_ids
+
+
+def _create_hashtags(hashtags):
+    """
+    Inserts new hashtags. If a concurrent ingestion inserted some of them in the meantime, the unique key
+    makes the batch fail, so they're created one by one, skipping the existing ones.
+    """
+    try:
+        with transaction.atomic():
+            Hashtag.objects.bulk_create(hashtags)
+    except IntegrityError:
+        for hashtag in hashtags:
+            Hashtag.objects.get_or_create(key=hashtag.key, defaults={'name': hashtag.name})
+
+
+def _insert_tweets(tweets):
+    """
+    Inserts the tweets that aren't stored yet. The whole batch is tried at once, which only fails when some
+    were stored before (a page fetched again by a retry or an overlapping fetch, or by a concurrent worker).
+    Then the stored ones are left out, and if another worker inserted some in the meantime, the rest are
+    inserted one by one.
+    :param tweets: Unsaved Tweet objects, with distinct provider IDs.
+    :return: The list of the Tweet objects inserted.
+    """
+    try:
+        with transaction.atomic():
+            Tweet.objects.bulk_create(tweets, batch_size=LOOKUP_BATCH_SIZE)
+        return tweets
+    except IntegrityError:
+        pass
+
+    stored = set()
+    for batch in chunked([tweet.provider_id for tweet in tweets]):
+        stored.update(Tweet.objects.filter(provider_id__in=batch).values_list('provider_id', flat=True))
+    tweets = [tweet for tweet in tweets if tweet.provider_id not in stored]
+    if not tweets:
+        return []
+
+    try:
+        with transaction.atomic():
+            Tweet.objects.bulk_create(tweets, batch_size=LOOKUP_BATCH_SIZE)
+        return tweets
+    except IntegrityError:
+        inserted = []
+        for tweet in tweets:
+            _, created = Tweet.objects.get_or_create(provider_id=tweet.provider_id, defaults={
+                'owner': tweet.owner, 'text': tweet.text, 'creation_date': tweet.creation_date})
+            if created:
+                inserted.append(tweet)
+        return inserted
+
+
+def store_statuses(statuses):
+    """
+    Stores the tweets from a list of statuses returned by the Twitter API and links their hashtags, taking
+    them from the statuses' entities when the API includes them. Tweets already stored are skipped, so
+    storing the same statuses again is safe and only costs a few queries.
+    :param statuses: The tweepy Status objects.
+    :return: A StoredStatuses tuple with the list of the Tweet objects inserted and how many were skipped.
+    """
+    tweets_by_id = OrderedDict()
+    for status in statuses:
+        tweets_by_id.setdefault(str(status.id), Tweet(
+            provider_id=str(status.id), owner=status.user.screen_name,
+            owner_key=normalize_handle(status.user.screen_name), text=status.text, creation_date=status.created_at))
+    inserted = _insert_tweets(list(tweets_by_id.values()))
+
+    # Reading the tweets back to get their primary keys, which bulk_create doesn't always set
+    provider_ids = [tweet.provider_id for tweet in inserted]
+    saved_tweets = []
+    for batch in chunked(provider_ids):
+        saved_tweets.extend(Tweet.objects.filter(provider_id__in=batch)
+                            .only('id', 'provider_id', 'text', 'creation_date'))
+
+    known_hashtags = {}
+    for status in statuses:
+        hashtags = status_hashtags(status)
+        if hashtags is not None:
+            known_hashtags[str(status.id)] = hashtags
+    link_hashtags(saved_tweets, known_hashtags)
+    index_tweets(saved_tweets)
+    invalidate_scopes(owner_scope(tweet.owner_key) for tweet in inserted)
+
+    skipped = len(statuses) - len(saved_tweets)
+    TWEETS_INGESTED.inc(len(saved_tweets))
+    TWEETS_SKIPPED.inc(skipped)
+    if saved_tweets:
+        WRITE_BATCH_SIZE.observe(len(saved_tweets), 'tweets')
+
+    return StoredStatuses(saved_tweets, skipped)
+
+
+def iter_timeline(api, handle, since_id=None, max_id=None):
+    """
+    Walks a user's timeline from the newest to the oldest tweets, one page at a time, following max_id.
+    It stops when the API has nothing else to return, which happens at its history limit.
+    :param api: The tweepy API handler.
+    :param handle: The Twitter handle.
+    :param since_id: If given, only tweets newer than this ID are returned.
+    :param max_id: If given, only tweets older than or equal to this ID are returned.
+    :return: A generator of lists of statuses.
+    """
+    for _ in range(TIMELINE_MAX_PAGES):
+        kwargs = {'screen_name': handle, 'count': TIMELINE_PAGE_SIZE}
+        if since_id:
+            kwargs['since_id'] = since_id
+        if max_id:
+            kwargs['max_id'] = max_id
+
+        page = api.user_timeline(**kwargs)
+        if not page:
+            return
+
+        yield page
+        max_id = min(status.id for status in page) - 1
+
+
+def fetch_handle(user_id, handle, mode=None, since_id=None, max_id=None, newest_id=None, budget=None):
+    """
+    Fetches the tweets from a Twitter handle and stores them in the DB. A backfill walks the timeline back
+    from the oldest stored tweet (or from the newest one, for new handles) to the API's history limit,
+    while a refresh only asks for the tweets newer than the newest stored one.
+    The calls are spread over the users' tokens according to their rate limits (see tweet_monitor.ratelimit).
+    When none has quota left, RateLimited is raised with the arguments to resume the fetch later.
+    :param user_id: The ID of the user whose Twitter credentials will be used.
+    :param handle: The Twitter handle.
+    :param mode: Either FetchJob.MODE_BACKFILL or FetchJob.MODE_REFRESH. By default, new handles get a
+    backfill and known handles get a refresh.
+    :param since_id: Resumes an interrupted refresh, which only fetches tweets newer than this ID.
+    :param max_id: Resumes an interrupted refresh, which goes on from the tweets older than or equal to this ID.
+    :param newest_id: Resumes an interrupted refresh, which got tweets up to this ID before being interrupted.
+    :param budget: A RefreshBudget each API call is charged to, if any. When it's spent, RateLimited is raised
+    as well, until its next interval.
+    :return: A tuple with the outcome, one of FetchJob.OUTCOME_CHOICES, and a message for the user.
+    """
+    tracked, _ = TrackedHandle.objects.get_or_create(key=normalize_handle(handle), defaults={'handle': handle})
+    if mode is None:
+        mode = FetchJob.MODE_REFRESH if tracked.newest_id else FetchJob.MODE_BACKFILL
+
+    if since_id is None and max_id is None:
+        if mode == FetchJob.MODE_REFRESH:
+            since_id = tracked.newest_id
+        elif tracked.oldest_id:
+            max_id = tracked.oldest_id - 1
+
+    tweepy_handler = ScheduledAPI(user_id, budget=budget)
+
+    stored_count = skipped_count = 0
+    is_refresh = mode == FetchJob.MODE_REFRESH
+    try:
+        for statuses in iter_timeline(tweepy_handler, handle, since_id=since_id, max_id=max_id):
+            stored = store_statuses(statuses)
+            # The tweets between this page and since_id aren't stored yet, so a refresh keeps newest_id where
+            # it was until it gets to since_id. Otherwise, if it failed now, the next refresh would skip them.
+            tracked.record_fetch(statuses, len(stored.tweets), advance_newest=not is_refresh)
+            stored_count += len(stored.tweets)
+            skipped_count += stored.skipped
+            newest_id = max([status.id for status in statuses] + [newest_id or 0])
+            max_id = min(status.id for status in statuses) - 1
+    except RateLimited as err:
+        # A backfill resumes from the oldest stored tweet anyway, but a refresh has to remember the gap
+        # between the newest tweet it started from and the oldest one it got to
+        if is_refresh:
+            err.resume = {'mode': mode, 'since_id': since_id, 'max_id': max_id, 'newest_id': newest_id}
+        else:
+            err.resume = {'mode': mode, 'since_id': since_id, 'max_id': None}
+        raise
+    except TweepError as err:
+        status_code = err.response.status_code if err.response is not None else None
+        # Refreshing a handle the API refuses would only waste the refresh budget. Mistyped handles aren't
+        # kept at all, while the handles with stored tweets keep what is known about them.
+        if status_code == 404 and not tracked.tweet_count:
+            tracked.delete()
+        elif status_code in (401, 404):
+            tracked.mark_unavailable()
+        else:
+            tracked.schedule_refresh()
+
+        if status_code == 404:
+            return (FetchJob.OUTCOME_NOT_FOUND,
+                    "The provided Twitter handle doesn't exist. Please check the spelling.")
+        elif status_code == 401:
+            return (FetchJob.OUTCOME_PROTECTED,
+                    "{}'s timeline is protected, we can't fetch his/her tweets.".format(handle))
+        return (FetchJob.OUTCOME_ERROR,
+                "There was a problem in the request, please check the handle spelling and try again.")
+
+    if is_refresh:
+        tracked.finish_refresh(newest_id)
+    tracked.schedule_refresh()
+    message = "{} new tweets from @{} were added successfully!".format(stored_count, handle)
+    if skipped_count:
+        message += " {} already stored were skipped.".format(skipped_count)
+    return FetchJob.OUTCOME_SUCCESS, message
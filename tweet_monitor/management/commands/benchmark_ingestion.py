@@ -0,0 +1,101 @@
+from collections import Counter
+import time
+import tracemalloc
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from social_django.models import UserSocialAuth
+
+from tweet_monitor.clients import api_clients
+from tweet_monitor.ingestion import fetch_handle
+from tweet_monitor.models import FetchJob, Tweet
+from tweet_monitor.ratelimit import RateLimited
+
+
+class Command(BaseCommand):
+    """
+    Measures the ingestion path (fetching, storing, hashtags, search index and counts) against the fake
+    Twitter backend, so regressions show up without network access. Everything is done in a transaction
+    that's rolled back at the end, leaving the DB as it was.
+    """
+    help = "Benchmark the tweet ingestion with synthetic timelines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--handles', type=int, default=10, help="How many handles are fetched.")
+        parser.add_argument('--timeline-size', type=int, default=3200, help="How many tweets each handle has.")
+        parser.add_argument('--hashtag-density', type=float, default=1.0, help="Average hashtags per tweet.")
+        parser.add_argument('--latency', type=float, default=0.0, help="Seconds taken by each API call.")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Share of the API calls failing.")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the injected errors.")
+
+    def handle(self, *args, **options):
+        fake_twitter = {
+            'TIMELINE_SIZE': options['timeline_size'],
+            'HASHTAG_DENSITY': options['hashtag_density'],
+            'LATENCY': options['latency'],
+            'ERROR_RATE': options['error_rate'],
+            'SEED': options['seed'],
+        }
+        run_id = uuid.uuid4().hex[:8]
+        handles = ['bench{}x{}'.format(run_id, number) for number in range(options['handles'])]
+
+        # The metrics, rate limit buckets and cached responses are kept in the cache, so the benchmark gets
+        # its own to leave the real ones alone
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                              'LOCATION': 'benchmark-' + run_id}}
+        with override_settings(TWITTER_API_BACKEND='tweet_monitor.fake_twitter.FakeTwitterAPI',
+                               FAKE_TWITTER=fake_twitter, CACHES=caches):
+            api_clients.clear()
+            try:
+                with transaction.atomic():
+                    results = self.run(run_id, handles)
+                    transaction.set_rollback(True)
+            finally:
+                api_clients.clear()
+
+        elapsed, query_count, peak_memory, tweet_count, outcomes = results
+        self.stdout.write("Handles: {}".format(len(handles)))
+        self.stdout.write("Tweets stored: {}".format(tweet_count))
+        self.stdout.write("Time: {:.2f} s".format(elapsed))
+        self.stdout.write("Throughput: {:.1f} tweets/s".format(tweet_count / elapsed if elapsed else 0))
+        queries_per_handle = query_count / len(handles) if handles else 0
+        self.stdout.write("Queries: {} ({:.1f} per handle)".format(query_count, queries_per_handle))
+        self.stdout.write("Peak memory: {:.1f} MiB".format(peak_memory / 2 ** 20))
+        self.stdout.write("Outcomes: {}".format(", ".join(
+            "{} {}".format(count, outcome) for outcome, count in sorted(outcomes.items()))))
+
+    def run(self, run_id, handles):
+        user = get_user_model().objects.create_user(username='benchmark-' + run_id)
+        UserSocialAuth.objects.create(user=user, provider='twitter', uid='benchmark-' + run_id, extra_data={
+            'access_token': {'oauth_token': 'token', 'oauth_token_secret': 'secret'}})
+
+        outcomes = Counter()
+        query_count = 0
+        elapsed = 0
+        # The queries are logged only to be counted, and the log is emptied after each handle to keep it short
+        force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        tracemalloc.start()
+        try:
+            for handle in handles:
+                connection.queries_log.clear()
+                start = time.perf_counter()
+                try:
+                    outcome, _ = fetch_handle(user.id, handle, FetchJob.MODE_BACKFILL)
+                except RateLimited:
+                    outcome = FetchJob.OUTCOME_RATE_LIMITED
+                elapsed += time.perf_counter() - start
+                query_count += len(connection.queries_log)
+                outcomes[outcome] += 1
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            connection.force_debug_cursor = force_debug_cursor
+            connection.queries_log.clear()
+
+        tweet_count = Tweet.objects.filter(owner_key__startswith='bench' + run_id).count()
+        return elapsed, query_count, peak_memory, tweet_count, outcomes
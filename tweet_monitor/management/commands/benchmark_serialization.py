@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from rest_framework.renderers import JSONRenderer
+
+from tweet_monitor.ingestion import store_statuses
+from tweet_monitor.models import Hashtag, Tweet
+from tweet_monitor.serializers import TweetRowSerializer, TweetSerializer
+
+
+class Command(BaseCommand):
+    """
+    Compares the time taken to render a page of tweets as JSON by TweetSerializer, from model instances, and by
+    TweetRowSerializer, from values() rows, checking that both give the same bytes. The tweets are created in
+    a transaction that's rolled back at the end, leaving the DB as it was.
+    """
+    help = "Benchmark the serialization of the tweet lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tweets', type=int, default=1000, help="How many tweets are serialized.")
+        parser.add_argument('--hashtags', type=int, default=3, help="Hashtags per tweet.")
+        parser.add_argument('--rounds', type=int, default=5, help="How many times each serializer runs.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            results = self.run(options['tweets'], options['hashtags'], options['rounds'])
+            transaction.set_rollback(True)
+
+        model_time, rows_time, same_output = results
+        if not same_output:
+            raise CommandError("The serializers gave different outputs.")
+
+        self.stdout.write("Tweets: {}".format(options['tweets']))
+        self.stdout.write("TweetSerializer: {:.1f} ms".format(model_time * 1000))
+        self.stdout.write("TweetRowSerializer: {:.1f} ms".format(rows_time * 1000))
+        self.stdout.write("Speedup: {:.1f}x".format(model_time / rows_time if rows_time else 0))
+
+    def run(self, tweet_count, hashtag_count, rounds):
+        owner = 'bench{}'.format(uuid.uuid4().hex[:8])
+        first_id = Tweet.objects.count() + 10 ** 15
+        store_statuses([SimpleNamespace(
+            id=first_id + number, user=SimpleNamespace(screen_name=owner), created_at=timezone.now(),
+            text="Benchmark tweet {} ".format(number) + " ".join(
+                "#bench{}".format((number + tag) % 50) for tag in range(hashtag_count)))
+            for number in range(tweet_count)])
+        queryset = Tweet.objects.filter(owner_key=owner).order_by('-creation_date', '-id')
+
+        def render_models():
+            tweets = queryset.prefetch_related(Prefetch('hashtags', queryset=Hashtag.objects.order_by('id')))
+            return JSONRenderer().render(TweetSerializer(tweets, many=True).data)
+
+        def render_rows():
+            serializer = TweetRowSerializer()
+            return JSONRenderer().render(serializer.to_representation(list(queryset.values(*serializer.get_columns()))))
+
+        model_time, model_output = self.measure(render_models, rounds)
+        rows_time, rows_output = self.measure(render_rows, rounds)
+        return model_time, rows_time, model_output == rows_output
+
+    @staticmethod
+    def measure(function, rounds):
+        """ Returns the best time of a few calls of a function, and what it returned. """
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            output = function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
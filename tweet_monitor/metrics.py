@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+import logging
+import time
+
+from django.core.cache import cache
+
+from celery import current_app
+
+
+logger = logging.getLogger(__name__)
+
+# Counters never expire, Prometheus handles them being reset (e.g. evicted) anyway
+METRIC_TIMEOUT = None
+
+# The status codes of the Twitter API errors counted apart, the others are counted as "other"
+TRACKED_STATUS_CODES = ('401', '403', '404', '429', '500', '502', '503', '504')
+
+CELERY_QUEUES = ('celery',)
+
+
+def _metric_key(name, labels):
+    return 'tweet_monitor:metrics:{}:{}'.format(name, ','.join('{}={}'.format(*label) for label in labels))
+
+
+def _increment(key, amount):
+    """
+    Adds to a counter kept in the cache. The cache is shared by every web and worker process (Redis in
+    production) and increments are atomic, so no count is lost between processes.
+    """
+    if not amount:
+        return
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # The counter doesn't exist yet, unless another process just created it
+        if not cache.add(key, amount, METRIC_TIMEOUT):
+            cache.incr(key, amount)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in labels) + '}'
+
+
+class Counter(object):
+    """
+    A Prometheus counter, optionally split by one label whose values are known in advance, so they can be
+    read back without listing the cache keys.
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, label=None, label_values=()):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.label_values = label_values
+
+    def _labels(self, label_value=None):
+        return ((self.label, label_value),) if self.label else ()
+
+    def inc(self, amount=1, label_value=None):
+        _increment(_metric_key(self.name, self._labels(label_value)), amount)
+
+    def keys(self):
+        if not self.label:
+            return [_metric_key(self.name, ())]
+        return [_metric_key(self.name, self._labels(value)) for value in self.label_values]
+
+    def samples(self, values):
+        """
+        Returns the samples of the metric, from the values read from the cache.
+        :param values: A dict with the values of the keys returned by keys().
+        :return: A list of (name, labels, value) tuples.
+        """
+        labels = [self._labels(value) for value in self.label_values] if self.label else [()]
+        return [(self.name, sample_labels, values.get(key, 0))
+                for key, sample_labels in zip(self.keys(), labels)]
+
+
+class Histogram(Counter):
+    """ A Prometheus histogram, keeping a counter per bucket plus the sum of the values (as integer micros). """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, label=None, label_values=()):
+        super(Histogram, self).__init__(name, documentation, label, label_values)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def _bucket_labels(self, label_value, bound):
+        return self._labels(label_value) + (('le', '+Inf' if bound == float('inf') else repr(bound)),)
+
+    def observe(self, value, label_value=None):
+        bound = next(bound for bound in self.buckets if value <= bound)
+        _increment(_metric_key(self.name + '_bucket', self._bucket_labels(label_value, bound)), 1)
+        _increment(_metric_key(self.name + '_sum', self._labels(label_value)), int(round(value * 10 ** 6)))
+
+    def keys(self):
+        keys = []
+        for label_value in (self.label_values if self.label else [None]):
+            keys.append(_metric_key(self.name + '_sum', self._labels(label_value)))
+            keys.extend(_metric_key(self.name + '_bucket', self._bucket_labels(label_value, bound))
+                        for bound in self.buckets)
+        return keys
+
+    def samples(self, values):
+        samples = []
+        for label_value in (self.label_values if self.label else [None]):
+            # Prometheus buckets are cumulative, counting every value lower than or equal to their bound
+            count = 0
+            for bound in self.buckets:
+                count += values.get(_metric_key(self.name + '_bucket', self._bucket_labels(label_value, bound)), 0)
+                samples.append((self.name + '_bucket', self._bucket_labels(label_value, bound), count))
+            samples.append((self.name + '_count', self._labels(label_value), count))
+            samples.append((self.name + '_sum', self._labels(label_value), values.get(
+                _metric_key(self.name + '_sum', self._labels(label_value)), 0) / 10 ** 6))
+        return samples
+
+
+TWEETS_INGESTED = Counter('tweet_monitor_tweets_ingested_total', "Tweets stored by the ingestion.")
+TWEETS_SKIPPED = Counter('tweet_monitor_tweets_skipped_total', "Fetched tweets skipped for being already stored.")
+HASHTAG_LINKS = Counter('tweet_monitor_hashtag_links_total', "Tweet-hashtag links created by the ingestion.")
+TIMELINE_LATENCY = Histogram('tweet_monitor_timeline_request_seconds', "Duration of the user_timeline calls.",
+                             buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+TIMELINE_ERRORS = Counter('tweet_monitor_timeline_errors_total', "Failed user_timeline calls, by status code.",
+                          label='status', label_values=TRACKED_STATUS_CODES + ('other',))
+WRITE_BATCH_SIZE = Histogram('tweet_monitor_write_batch_size', "Rows inserted by each batch of the ingestion.",
+                             buckets=(1, 10, 50, 100, 200, 500, 1000), label='table',
+                             label_values=('tweets', 'hashtag_links'))
+
+METRICS = (TWEETS_INGESTED, TWEETS_SKIPPED, HASHTAG_LINKS, TIMELINE_LATENCY, TIMELINE_ERRORS, WRITE_BATCH_SIZE)
+
+
+@contextmanager
+def time_timeline_request():
+    """ Records the duration of a user_timeline call made in the block, and its status code if it fails. """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as err:
+        status_code = str(getattr(getattr(err, 'response', None), 'status_code', ''))
+        TIMELINE_ERRORS.inc(label_value=status_code if status_code in TRACKED_STATUS_CODES else 'other')
+        raise
+    finally:
+        TIMELINE_LATENCY.observe(time.perf_counter() - start)
+
+
+def celery_queue_lengths():
+    """
+    Returns how many tasks wait in each Celery queue, asking the broker.
+    :return: A dict with the length of each queue in CELERY_QUEUES, empty if the broker can't be reached
+    or the tasks run eagerly.
+    """
+    if current_app.conf.task_always_eager:
+        return {}
+    try:
+        with current_app.connection_for_read() as connection:
+            connection.ensure_connection(max_retries=1)
+            channel = connection.default_channel
+            return {queue: channel.queue_declare(queue=queue, passive=True).message_count for queue in CELERY_QUEUES}
+    except Exception:
+        logger.warning("Couldn't read the length of the Celery queues", exc_info=True)
+        return {}
+
+
+def render_metrics(gauges=()):
+    """
+    Renders the metrics in the Prometheus text format, reading every counter in one cache call.
+    :param gauges: Extra (name, documentation, samples) tuples, with samples as (labels, value) tuples.
+    :return: A string.
+    """
+    values = cache.get_many([key for metric in METRICS for key in metric.keys()])
+
+    lines = []
+    for metric in METRICS:
+        lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+        lines.extend('{}{} {}'.format(name, _format_labels(labels), value)
+                     for name, labels, value in metric.samples(values))
+    for name, documentation, samples in gauges:
+        lines.append('# HELP {} {}'.format(name, documentation))
+        lines.append('# TYPE {} gauge'.format(name))
+        lines.extend('{}{} {}'.format(name, _format_labels(labels), value) for labels, value in samples)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 15:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0002_fetchjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchjob',
+            name='mode',
+            field=models.CharField(blank=True, choices=[('backfill', 'Backfill'), ('refresh', 'Refresh')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 15:23
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0003_fetchjob_mode'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='tweet',
+            index_together=set([('creation_date', 'id')]),
+        ),
+    ]
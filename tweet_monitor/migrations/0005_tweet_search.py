@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 15:25
+from __future__ import unicode_literals
+
+from collections import Counter
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_full_text_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE INDEX tweet_monitor_tweet_text_fts ON tweet_monitor_tweet "
+                              "USING gin (to_tsvector('english', text))")
+
+
+def drop_full_text_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS tweet_monitor_tweet_text_fts")
+
+
+def index_existing_tweets(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+
+    Tweet = apps.get_model('tweet_monitor', 'Tweet')
+    TweetToken = apps.get_model('tweet_monitor', 'TweetToken')
+    tokens = []
+    for tweet_id, text in Tweet.objects.values_list('id', 'text').iterator():
+        for token, occurrences in Counter(re.findall(r'\w+', text.lower(), re.UNICODE)).items():
+            tokens.append(TweetToken(tweet_id=tweet_id, token=token, occurrences=occurrences))
+    TweetToken.objects.bulk_create(tokens, batch_size=300)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0004_tweet_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TweetToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=150)),
+                ('occurrences', models.PositiveSmallIntegerField(default=1)),
+                ('tweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='tweet_monitor.Tweet')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='tweettoken',
+            unique_together=set([('token', 'tweet')]),
+        ),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+        migrations.RunPython(index_existing_tweets, migrations.RunPython.noop),
+    ]
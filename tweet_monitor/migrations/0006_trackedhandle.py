@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 15:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+def fill_owner_keys(apps, schema_editor):
+    Tweet = apps.get_model('tweet_monitor', 'Tweet')
+    TrackedHandle = apps.get_model('tweet_monitor', 'TrackedHandle')
+
+    provider_ids_by_key = {}
+    for owner in Tweet.objects.values_list('owner', flat=True).distinct():
+        key = owner.strip().lstrip('@').lower()
+        Tweet.objects.filter(owner=owner).update(owner_key=key)
+        provider_ids_by_key.setdefault(key, (owner, []))[1].extend(
+            int(provider_id) for provider_id in Tweet.objects.filter(owner=owner).values_list('provider_id', flat=True))
+
+    for key, (owner, provider_ids) in provider_ids_by_key.items():
+        TrackedHandle.objects.create(key=key, handle=owner, tweet_count=len(provider_ids),
+                                     newest_id=max(provider_ids), oldest_id=min(provider_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0005_tweet_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackedHandle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('handle', models.CharField(max_length=50)),
+                ('last_fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('tweet_count', models.PositiveIntegerField(default=0)),
+                ('newest_id', models.BigIntegerField(blank=True, null=True)),
+                ('oldest_id', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='tweet',
+            name='owner_key',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(fill_owner_keys, migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='tweet',
+            index_together=set([('creation_date', 'id'), ('owner_key', 'creation_date', 'id')]),
+        ),
+    ]
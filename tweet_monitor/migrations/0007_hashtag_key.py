@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def merge_duplicated_hashtags(apps, schema_editor):
+    """ Fills the hashtags' keys, merging the hashtags that only differ by their casing into the oldest one. """
+    Hashtag = apps.get_model('tweet_monitor', 'Hashtag')
+    Through = apps.get_model('tweet_monitor', 'Tweet').hashtags.through
+
+    hashtag_ids_by_key = {}
+    for hashtag_id, name in Hashtag.objects.order_by('id').values_list('id', 'name'):
+        hashtag_ids_by_key.setdefault(name.strip().lstrip('#').lower(), []).append(hashtag_id)
+
+    for key, hashtag_ids in hashtag_ids_by_key.items():
+        kept_id, duplicated_ids = hashtag_ids[0], hashtag_ids[1:]
+        if duplicated_ids:
+            linked_tweet_ids = set(Through.objects.filter(hashtag_id=kept_id).values_list('tweet_id', flat=True))
+            for link in Through.objects.filter(hashtag_id__in=duplicated_ids).order_by('id'):
+                if link.tweet_id in linked_tweet_ids:
+                    link.delete()
+                else:
+                    linked_tweet_ids.add(link.tweet_id)
+                    Through.objects.filter(pk=link.pk).update(hashtag_id=kept_id)
+            Hashtag.objects.filter(id__in=duplicated_ids).delete()
+
+        Hashtag.objects.filter(id=kept_id).update(key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0006_trackedhandle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='key',
+            field=models.CharField(max_length=150, null=True),
+        ),
+        # The unique constraint is added by the next migration: PostgreSQL can't alter the table in the
+        # transaction that deleted the duplicated hashtags, while their deferred constraint checks are pending
+        migrations.RunPython(merge_duplicated_hashtags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0007_hashtag_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hashtag',
+            name='key',
+            field=models.CharField(max_length=150, unique=True),
+        ),
+    ]
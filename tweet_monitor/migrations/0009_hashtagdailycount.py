@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 15:34
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def count_existing_uses(apps, schema_editor):
+    Tweet = apps.get_model('tweet_monitor', 'Tweet')
+    HashtagDailyCount = apps.get_model('tweet_monitor', 'HashtagDailyCount')
+
+    counts = Counter(
+        (hashtag_id, timezone.localtime(creation_date).date()) for hashtag_id, creation_date
+        in Tweet.hashtags.through.objects.values_list('hashtag_id', 'tweet__creation_date').iterator())
+    HashtagDailyCount.objects.bulk_create([
+        HashtagDailyCount(hashtag_id=hashtag_id, day=day, count=count)
+        for (hashtag_id, day), count in counts.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0008_hashtag_key_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HashtagDailyCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_counts', to='tweet_monitor.Hashtag')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='hashtagdailycount',
+            unique_together=set([('hashtag', 'day')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='hashtagdailycount',
+            index_together=set([('day', 'hashtag', 'count')]),
+        ),
+        migrations.RunPython(count_existing_uses, migrations.RunPython.noop),
+    ]
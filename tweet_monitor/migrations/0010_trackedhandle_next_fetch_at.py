@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 15:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def schedule_refreshes(apps, schema_editor):
+    # The handles tracked so far are refreshed as soon as the periodic refresh starts
+    TrackedHandle = apps.get_model('tweet_monitor', 'TrackedHandle')
+    TrackedHandle.objects.update(next_fetch_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0009_hashtagdailycount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackedhandle',
+            name='next_fetch_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(schedule_refreshes, migrations.RunPython.noop),
+    ]
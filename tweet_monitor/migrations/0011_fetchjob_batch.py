@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 15:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0010_trackedhandle_next_fetch_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchjob',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fetchjob',
+            name='outcome',
+            field=models.CharField(blank=True, choices=[('success', 'Success'), ('not_found', 'Not found'), ('protected', 'Protected'), ('rate_limited', 'Rate limited'), ('error', 'Error')], max_length=15),
+        ),
+    ]
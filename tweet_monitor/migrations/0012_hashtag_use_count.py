@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 16:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def count_existing_uses(apps, schema_editor):
+    Hashtag = apps.get_model('tweet_monitor', 'Hashtag')
+    HashtagDailyCount = apps.get_model('tweet_monitor', 'HashtagDailyCount')
+
+    totals = HashtagDailyCount.objects.values_list('hashtag_id').annotate(total=Sum('count')).order_by()
+    for hashtag_id, total in totals.iterator():
+        Hashtag.objects.filter(pk=hashtag_id).update(use_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0011_fetchjob_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='use_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(count_existing_uses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 16:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweet_monitor', '0012_hashtag_use_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackedhandle',
+            name='unavailable',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,8 +1,44 @@
+import datetime
+import uuid
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Min
+from django.utils import timezone
+
+from common.models import IndexedTimeStampedModel
+
+from .cache import HASHTAG_LIST_SCOPE, hashtag_scope, invalidate_scopes
+from .hashtags import extract_hashtags
+
+
+def normalize_handle(handle):
+    """
+    Returns the key used to look up a Twitter handle, since handles are case insensitive.
+    :param handle: The Twitter handle, with or without the "@".
+    :return: The lowercase handle without the "@".
+    """
+    return handle.strip().lstrip('@').lower()
+
+
+def normalize_hashtag(hashtag):
+    """
+    Returns the key used to store and look up a hashtag, since hashtags are case insensitive.
+    :param hashtag: The hashtag, with or without the "#".
+    :return: The lowercase hashtag without the "#".
+    """
+    return hashtag.strip().lstrip('#').lower()
 
 
 class Hashtag(models.Model):
     name = models.CharField(max_length=150)
+    key = models.CharField(max_length=150, unique=True)
+    # How many tweets used the hashtag, kept up to date with its daily counts (see tweet_monitor.trends)
+    use_count = models.PositiveIntegerField(default=0, db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.key = normalize_hashtag(self.name)
+        super(Hashtag, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -12,16 +48,183 @@ class Tweet(models.Model):
     provider_id = models.CharField(max_length=30, unique=True)
     text = models.CharField(max_length=150)
     owner = models.CharField(max_length=50)
+    owner_key = models.CharField(max_length=50, default='', editable=False)
     creation_date = models.DateTimeField()
     hashtags = models.ManyToManyField(Hashtag)
 
-    def extract_hashtags(self):
-        words = self.text.split()
-        temp_list = [word for word in words if word[0] == "#"]
+    class Meta:
+        # Back the keyset pagination of the tweet lists, which are ordered by creation date and ID
+        index_together = [('creation_date', 'id'), ('owner_key', 'creation_date', 'id')]
+
+    def save(self, *args, **kwargs):
+        self.owner_key = normalize_handle(self.owner)
+        super(Tweet, self).save(*args, **kwargs)
 
-        for ht in temp_list:
-            obj, created = Hashtag.objects.get_or_create(name=ht)
+    def extract_hashtags(self):
+        scopes = []
+        for ht in extract_hashtags(self.text):
+            obj, created = Hashtag.objects.get_or_create(key=normalize_hashtag(ht), defaults={'name': ht})
             self.hashtags.add(obj)
+            scopes += [hashtag_scope(obj.key)] + ([HASHTAG_LIST_SCOPE] if created else [])
+
+        invalidate_scopes(scopes)
 
     def __str__(self):
         return "@{}: {} at {}".format(self.owner, self.text, self.creation_date)
+
+
+class TweetToken(models.Model):
+    """
+    An entry of the inverted index used to search the tweets' text on databases without full-text search.
+    PostgreSQL uses an expression index over to_tsvector instead, see tweet_monitor.search.
+    """
+    tweet = models.ForeignKey(Tweet, related_name='tokens', on_delete=models.CASCADE)
+    token = models.CharField(max_length=150)
+    occurrences = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = [('token', 'tweet')]
+
+    def __str__(self):
+        return "{} in {}".format(self.token, self.tweet_id)
+
+
+class HashtagDailyCount(models.Model):
+    """
+    How many tweets used a hashtag on a day (in the site's time zone). It's kept up to date by the ingestion,
+    see tweet_monitor.trends, so usage over a window is read from a few rows per hashtag instead of counted
+    from the tweets.
+    """
+    hashtag = models.ForeignKey(Hashtag, related_name='daily_counts', on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('hashtag', 'day')]
+        # Covers the windowed sums of the trending hashtags, which filter on the day
+        index_together = [('day', 'hashtag', 'count')]
+
+    def __str__(self):
+        return "{} on {}: {}".format(self.hashtag_id, self.day, self.count)
+
+
+class TrackedHandle(IndexedTimeStampedModel):
+    """ A Twitter handle whose tweets are stored, with what is known about its timeline. """
+    # A handle is refreshed when about this many new tweets are expected, within these bounds
+    REFRESH_EXPECTED_TWEETS = 20
+    REFRESH_MIN_INTERVAL = datetime.timedelta(minutes=15)
+    REFRESH_MAX_INTERVAL = datetime.timedelta(days=1)
+
+    key = models.CharField(max_length=50, unique=True)
+    handle = models.CharField(max_length=50)
+    last_fetched_at = models.DateTimeField(null=True, blank=True)
+    next_fetch_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    tweet_count = models.PositiveIntegerField(default=0)
+    newest_id = models.BigIntegerField(null=True, blank=True)
+    oldest_id = models.BigIntegerField(null=True, blank=True)
+    # Set when the API refuses the timeline (the handle doesn't exist or is protected), which stops the
+    # scheduled refreshes until a fetch succeeds again
+    unavailable = models.BooleanField(default=False)
+
+    def record_fetch(self, statuses, stored_count, advance_newest=True):
+        """
+        Updates the handle after a page of its timeline was stored.
+        :param statuses: The statuses of the page.
+        :param stored_count: How many of them were stored.
+        :param advance_newest: Whether newest_id can move to the page's tweets. A refresh walks from the newest
+        tweets back to newest_id, so it only moves it once the whole walk is done (see finish_refresh).
+        """
+        provider_ids = [status.id for status in statuses]
+        if provider_ids:
+            self.handle = statuses[0].user.screen_name
+            if advance_newest:
+                self.newest_id = max(provider_ids + [self.newest_id or 0])
+            self.oldest_id = min(provider_ids + [self.oldest_id or provider_ids[0]])
+        self.tweet_count += stored_count
+        self.last_fetched_at = timezone.now()
+        self.save()
+
+    def finish_refresh(self, newest_id):
+        """
+        Moves newest_id forward after a refresh stored every tweet newer than it, so the next refresh starts
+        from there. Until then, an interrupted refresh leaves it as it was and the next one fetches the gap again.
+        :param newest_id: The ID of the newest tweet the refresh got, if any.
+        """
+        if newest_id and newest_id > (self.newest_id or 0):
+            self.newest_id = newest_id
+            self.save(update_fields=['newest_id', 'modified'])
+
+    def schedule_refresh(self):
+        """
+        Sets when the handle should be refreshed next, after a fetch finished. Its posting frequency is taken
+        from the tweets stored since its oldest one, so busy handles are refreshed often and dormant ones
+        rarely, once a day at least.
+        """
+        now = timezone.now()
+        interval = self.REFRESH_MAX_INTERVAL
+        first_tweet_at = Tweet.objects.filter(owner_key=self.key).aggregate(first=Min('creation_date'))['first']
+        if self.tweet_count and first_tweet_at and first_tweet_at < now:
+            tweets_per_second = self.tweet_count / (now - first_tweet_at).total_seconds()
+            interval = datetime.timedelta(seconds=self.REFRESH_EXPECTED_TWEETS / tweets_per_second)
+
+        self.last_fetched_at = now
+        self.next_fetch_at = now + min(max(interval, self.REFRESH_MIN_INTERVAL), self.REFRESH_MAX_INTERVAL)
+        self.unavailable = False
+        self.save(update_fields=['last_fetched_at', 'next_fetch_at', 'unavailable', 'modified'])
+
+    def mark_unavailable(self):
+        """ Stops the scheduled refreshes of the handle, after the API refused its timeline. """
+        self.last_fetched_at = timezone.now()
+        self.next_fetch_at = None
+        self.unavailable = True
+        self.save(update_fields=['last_fetched_at', 'next_fetch_at', 'unavailable', 'modified'])
+
+    def __str__(self):
+        return "@{}".format(self.handle)
+
+
+class FetchJob(IndexedTimeStampedModel):
+    """ A background fetch of a Twitter handle's tweets, which can be polled for its status. """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILURE = 'failure'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCESS, 'Success'),
+        (STATUS_FAILURE, 'Failure'),
+    )
+
+    MODE_BACKFILL = 'backfill'
+    MODE_REFRESH = 'refresh'
+    MODE_CHOICES = (
+        (MODE_BACKFILL, 'Backfill'),
+        (MODE_REFRESH, 'Refresh'),
+    )
+
+    OUTCOME_SUCCESS = 'success'
+    OUTCOME_NOT_FOUND = 'not_found'
+    OUTCOME_PROTECTED = 'protected'
+    OUTCOME_RATE_LIMITED = 'rate_limited'
+    OUTCOME_ERROR = 'error'
+    OUTCOME_CHOICES = (
+        (OUTCOME_SUCCESS, 'Success'),
+        (OUTCOME_NOT_FOUND, 'Not found'),
+        (OUTCOME_PROTECTED, 'Protected'),
+        (OUTCOME_RATE_LIMITED, 'Rate limited'),
+        (OUTCOME_ERROR, 'Error'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL)
+    handle = models.CharField(max_length=50)
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    outcome = models.CharField(max_length=15, choices=OUTCOME_CHOICES, blank=True)
+    message = models.CharField(max_length=255, blank=True)
+    # Jobs created together by a bulk fetch share it
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return "Fetch of @{} ({})".format(self.handle, self.status)
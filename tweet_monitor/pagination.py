@@ -0,0 +1,190 @@
+import base64
+from collections import OrderedDict
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that filters on the ordering values of the last row seen (the "keyset") instead of
+    using an OFFSET, so any page costs the same indexed range scan as the first one. The ordering must be
+    unique, which is why it always ends with the primary key. No COUNT(*) query is made.
+    """
+    ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request, queryset)
+        reverse = self.cursor is not None and self.cursor[0]
+
+        # One extra row tells if there's another page in the current direction
+        results = self.get_rows(queryset, reverse)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else self.cursor is not None
+
+        return self.page
+
+    def get_rows(self, queryset, reverse):
+        """
+        Returns the rows of the page starting after the cursor position, plus an extra one.
+        :param queryset: The queryset being paginated.
+        :param reverse: If True, the rows are the ones before the cursor position, in reverse order.
+        :return: A list.
+        """
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(self.cursor[1], reverse))
+        ordering = [self.invert(field) for field in self.ordering] if reverse else self.ordering
+
+        return list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def get_keyset_filter(self, position, reverse=False):
+        """
+        Builds the condition matching the rows after the given position in the ordering, e.g. for the
+        ('-creation_date', '-id') ordering: creation_date < x OR (creation_date = x AND id < y).
+        :param position: The ordering values of the row the page starts after.
+        :param reverse: If True, the rows before the position are matched instead.
+        :return: A Q object.
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= Q(**dict(equal, **{'{}__{}'.format(name, lookup): value}))
+            equal[name] = value
+
+        return condition
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    def get_position(self, row):
+        """ Returns the ordering values of a row, which can be a model instance or a dict. """
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def get_field_types(self, queryset):
+        """
+        Returns the functions converting the cursor values to the types of the ordering fields, which raise
+        ValidationError, TypeError or ValueError for values that don't fit.
+        :param queryset: The queryset being paginated.
+        :return: A list with a function per field of the ordering.
+        """
+        return [queryset.model._meta.get_field(field.lstrip('-')).to_python for field in self.ordering]
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            reverse, position = bool(cursor['r']), cursor['p']
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        # The values come from the client, so a crafted cursor could make the query fail
+        try:
+            position = [to_python(value) for to_python, value in zip(self.get_field_types(queryset), position)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, position
+
+    def encode_cursor(self, reverse, position):
+        # Datetimes keep their microseconds, otherwise rows could be skipped or repeated across pages
+        position = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in position]
+        cursor = json.dumps({'r': int(reverse), 'p': position})
+        encoded = base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.get_position(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # The cursor went past the last row, so the way back starts again from the first page
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(True, self.get_position(self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class TweetPagination(KeysetPagination):
+    """ Pages through tweets from the newest to the oldest ones. """
+    ordering = ('-creation_date', '-id')
+
+
+class HashtagPagination(KeysetPagination):
+    """ Pages through hashtags in the order they were created. """
+    ordering = ('id',)
+
+
+class SearchResultsPagination(KeysetPagination):
+    """
+    Pages through search results from the most to the least relevant. Searches return a bounded list of
+    dicts already ranked (see tweet_monitor.search), so the keyset is applied to that list.
+    """
+    ordering = ('-rank', '-id')
+
+    def get_field_types(self, results):
+        return [float, int]
+
+    def get_rows(self, results, reverse):
+        def sort_key(row):
+            return -row['rank'], -row['id']
+
+        rows = results[::-1] if reverse else results
+        if self.cursor is not None:
+            position = sort_key({'rank': self.cursor[1][0], 'id': self.cursor[1][1]})
+            rows = [row for row in rows if (sort_key(row) < position if reverse else sort_key(row) > position)]
+
+        return rows[:self.page_size + 1]
@@ -0,0 +1,191 @@
+from collections.abc import Mapping
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from social_django.models import UserSocialAuth
+from tweepy import TweepError
+
+from .clients import api_clients
+from .metrics import time_timeline_request
+
+
+# user_timeline allows 900 calls per user token every 15 minutes
+RATE_LIMIT_WINDOW = 15 * 60
+
+
+class RateLimited(Exception):
+    """
+    Raised when no token has quota left for a call. `wait` is how many seconds until one has, and `resume`
+    may be filled with the arguments that let the interrupted work continue where it stopped.
+    """
+
+    def __init__(self, wait, resume=None):
+        super(RateLimited, self).__init__("Rate limited for {:.0f} seconds".format(wait))
+        self.wait = wait
+        self.resume = resume or {}
+
+
+class TokenBuckets(object):
+    """
+    Keeps how many calls each user token has left in the current rate limit window, shared by every process
+    through the cache. Each token is a bucket taken from before every call and refilled when its window resets.
+    The responses' rate limit headers reset the accounting to what Twitter reports, so calls made elsewhere
+    (or lost counts) don't make it drift.
+    """
+
+    def __init__(self, endpoint='user_timeline', window=RATE_LIMIT_WINDOW):
+        self.endpoint = endpoint
+        self.window = window
+
+    def _keys(self, user_id):
+        prefix = 'tweet_monitor:ratelimit:{}:{}'.format(self.endpoint, user_id)
+        return prefix + ':remaining', prefix + ':reset'
+
+    def acquire(self, user_id):
+        """
+        Takes a call from a token's bucket.
+        :param user_id: The ID of the user owning the token.
+        :return: 0 if the call can be made now, otherwise how many seconds until the bucket is refilled.
+        """
+        remaining_key, reset_key = self._keys(user_id)
+        reset = cache.get(reset_key)
+        now = time.time()
+        if reset is None or reset <= now:
+            # Nothing known about the current window, so the bucket is full
+            return 0
+
+        try:
+            remaining = cache.decr(remaining_key)
+        except ValueError:
+            return 0
+        return 0 if remaining >= 0 else reset - now
+
+    def update(self, user_id, headers):
+        """
+        Sets a token's bucket to the quota reported by the API.
+        :param user_id: The ID of the user owning the token.
+        :param headers: The headers of the last response, with x-rate-limit-remaining and x-rate-limit-reset.
+        """
+        if not isinstance(headers, Mapping):
+            return
+        try:
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset = int(headers['x-rate-limit-reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+        self._set(user_id, remaining, reset)
+
+    def exhaust(self, user_id, reset=None):
+        """
+        Empties a token's bucket, after the API refused a call.
+        :param user_id: The ID of the user owning the token.
+        :param reset: When the window resets, as a timestamp. By default, a whole window from now.
+        """
+        if not reset or reset <= time.time():
+            reset = time.time() + self.window
+        self._set(user_id, 0, reset)
+
+    def _set(self, user_id, remaining, reset):
+        remaining_key, reset_key = self._keys(user_id)
+        timeout = max(int(reset - time.time()) + 1, 1)
+        cache.set_many({remaining_key: remaining, reset_key: reset}, timeout)
+
+
+token_buckets = TokenBuckets()
+
+
+class RefreshBudget(object):
+    """
+    Keeps how many timeline calls the scheduled refreshes made in the current interval, shared by every process
+    through the cache, and holds them back once settings.TWEET_REFRESH_BUDGET calls were made. The intervals
+    are the ones of the refresh schedule (settings.TWEET_REFRESH_INTERVAL, in seconds).
+    """
+
+    def _window(self):
+        interval = settings.TWEET_REFRESH_INTERVAL
+        now = time.time()
+        start = now - now % interval
+        return 'tweet_monitor:refresh_budget:{:.0f}'.format(start), start + interval - now
+
+    def acquire(self):
+        """
+        Takes a call from the budget of the current interval.
+        :return: 0 if the call can be made now, otherwise how many seconds until the next interval.
+        """
+        key, wait = self._window()
+        try:
+            used = cache.incr(key)
+        except ValueError:
+            # The interval just started, unless another process just counted its first call
+            used = 1 if cache.add(key, 1, int(wait) + 1) else cache.incr(key)
+        return 0 if used <= settings.TWEET_REFRESH_BUDGET else wait
+
+    def remaining(self):
+        """ Returns how many calls are left in the budget of the current interval. """
+        key, _ = self._window()
+        return max(settings.TWEET_REFRESH_BUDGET - cache.get(key, 0), 0)
+
+
+refresh_budget = RefreshBudget()
+
+
+class ScheduledAPI(object):
+    """
+    Stands for the API handler of a user in calls to user_timeline, taking each call from the bucket of that
+    user's token or, when it's empty, from any other Twitter user's token with quota left, which spreads the
+    work over every token. If none is left, RateLimited is raised, so the caller can delay the work. The same
+    happens when the calls are charged to a RefreshBudget with nothing left for the current interval.
+    """
+
+    def __init__(self, user_id, buckets=token_buckets, budget=None):
+        self.user_id = user_id
+        self.buckets = buckets
+        self.budget = budget
+        self._user_ids = None
+
+    def candidate_user_ids(self):
+        if self._user_ids is None:
+            others = UserSocialAuth.objects.filter(provider='twitter').exclude(user_id=self.user_id)
+            self._user_ids = [self.user_id] + list(others.values_list('user_id', flat=True).distinct())
+        return self._user_ids
+
+    def pick_user_id(self):
+        """
+        Returns the ID of a user whose token can make a call now, the own user's first.
+        :return: The user ID.
+        """
+        wait = self.buckets.acquire(self.user_id)
+        if not wait:
+            return self.user_id
+
+        waits = [wait]
+        for user_id in self.candidate_user_ids()[1:]:
+            wait = self.buckets.acquire(user_id)
+            if not wait:
+                return user_id
+            waits.append(wait)
+        raise RateLimited(min(waits))
+
+    def user_timeline(self, **kwargs):
+        wait = self.budget.acquire() if self.budget is not None else 0
+        if wait:
+            raise RateLimited(wait)
+
+        while True:
+            user_id = self.pick_user_id()
+            api = api_clients.get(user_id)
+            try:
+                with time_timeline_request():
+                    page = api.user_timeline(**kwargs)
+            except TweepError as err:
+                if err.response is None or err.response.status_code != 429:
+                    raise
+                # The bucket was off, so it's emptied until the window resets, and another token is tried
+                reset = err.response.headers.get('x-rate-limit-reset')
+                self.buckets.exhaust(user_id, int(reset) if reset else None)
+                continue
+
+            self.buckets.update(user_id, getattr(getattr(api, 'last_response', None), 'headers', None))
+            return page
@@ -0,0 +1,137 @@
+from collections import Counter
+import re
+
+from django.db import connection
+from django.db.models import Count, Sum
+
+from .models import TweetToken
+
+
+# Only the best ranked results of a search are kept, which bounds the cost of its pages
+SEARCH_RESULTS_LIMIT = 1000
+
+# PostgreSQL full-text search configuration, must match the expression index created by the migrations
+SEARCH_CONFIG = 'english'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Splits a text into lowercase words, dropping punctuation (including the hash of the hashtags).
+    :param text: The text.
+    :return: A list of tokens.
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+def uses_token_index():
+    """ Tells if searches go through the TweetToken inverted index, which is the case without PostgreSQL. """
+    return connection.vendor != 'postgresql'
+
+
+def index_tweets(tweets):
+    """
+    Adds the tokens of the given tweets to the inverted index, when it's being used.
+    :param tweets: Saved Tweet objects (they must have a primary key).
+    """
+    if not uses_token_index():
+        return
+
+    TweetToken.objects.bulk_create([
+        TweetToken(tweet_id=tweet.pk, token=token, occurrences=occurrences)
+        for tweet in tweets for token, occurrences in Counter(tokenize(tweet.text)).items()
+    ], batch_size=300)
+
+
+def index_saved_tweet(sender, instance, created, raw=False, **kwargs):
+    """ Signal receiver indexing the tweets saved one by one, since bulk_create doesn't send signals. """
+    if created and not raw:
+        index_tweets([instance])
+
+
+def match_tweets(queryset, query):
+    """
+    Restricts a tweets queryset to the ones containing every word of the query, without ranking them.
+    :param queryset: The Tweet queryset.
+    :param query: The words to be searched for.
+    :return: The filtered queryset.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return queryset.none()
+
+    if not uses_token_index():
+        return queryset.extra(
+            where=["to_tsvector(%s, tweet_monitor_tweet.text) @@ plainto_tsquery(%s, %s)"],
+            params=[SEARCH_CONFIG, SEARCH_CONFIG, query])
+
+    # Each term is a separate probe of the (token, tweet) index
+    for term in terms:
+        queryset = queryset.filter(tokens__token=term)
+    return queryset
+
+
+def matching_tweet_ids(query):
+    """
+    Returns the IDs of the tweets containing every word of the query, read from the inverted index alone.
+    It's meant to be used as a subquery, e.g. Tweet.objects.filter(id__in=matching_tweet_ids(query)).
+    :param query: The words to be searched for.
+    :return: A values queryset of TweetToken.
+    """
+    terms = set(tokenize(query))
+    return (TweetToken.objects.filter(token__in=terms).values('tweet_id')
+            .annotate(matched_terms=Count('token')).filter(matched_terms=len(terms)).values('tweet_id'))
+
+
+def count_term_matches(query):
+    """
+    Counts the tweets containing each word of a query, through the inverted index.
+    :param query: The words to be searched for.
+    :return: A dict with the number of tweets per term, including the ones without any, or None when the
+    inverted index isn't being used.
+    """
+    if not uses_token_index():
+        return None
+
+    terms = set(tokenize(query))
+    counts = dict.fromkeys(terms, 0)
+    counts.update(TweetToken.objects.filter(token__in=terms).values('token').annotate(tweets=Count('tweet_id'))
+                  .values_list('token', 'tweets'))
+    return counts
+
+
+def search_tweets(query, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Finds the tweets containing every word of the query, from the most to the least relevant.
+    :param query: The words to be searched for.
+    :param limit: The maximum number of results.
+    :return: A list of dicts with the `id` and `rank` of the tweets found.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    if not uses_token_index():
+        return _full_text_search(query, limit)
+
+    # A tweet matches when it has every term, and ranks higher the more times they appear in it
+    terms = set(terms)
+    matches = (TweetToken.objects.filter(token__in=terms).values('tweet_id')
+               .annotate(matched_terms=Count('token'), rank=Sum('occurrences'))
+               .filter(matched_terms=len(terms))
+               .order_by('-rank', '-tweet_id')[:limit])
+
+    return [{'id': match['tweet_id'], 'rank': match['rank']} for match in matches]
+
+
+def _full_text_search(query, limit):
+    """ Ranked search through PostgreSQL's full-text search, backed by a GIN index. """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id, ts_rank(to_tsvector(%s, text), query) AS rank "
+            "FROM tweet_monitor_tweet, plainto_tsquery(%s, %s) query "
+            "WHERE to_tsvector(%s, text) @@ query "
+            "ORDER BY rank DESC, id DESC LIMIT %s",
+            [SEARCH_CONFIG, SEARCH_CONFIG, query, SEARCH_CONFIG, limit])
+        return [{'id': tweet_id, 'rank': rank} for tweet_id, rank in cursor.fetchall()]
@@ -1,6 +1,19 @@
+from collections import OrderedDict
+
 from rest_framework import serializers
 
-from .models import Tweet, Hashtag
+from common.profiling import profile_section
+
+from .models import FetchJob, Hashtag, Tweet
+
+
+class ProfiledListSerializer(serializers.ListSerializer):
+    """
+    Serializing lists of objects, timed as the "serialize" section of the profiled requests
+    """
+    def to_representation(self, data):
+        with profile_section('serialize'):
+            return super(ProfiledListSerializer, self).to_representation(data)
 
 
 class HashtagSerializer(serializers.ModelSerializer):
@@ -10,6 +23,7 @@ class HashtagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Hashtag
         fields = ('name',)
+        list_serializer_class = ProfiledListSerializer
 
 
 class TweetSerializer(serializers.ModelSerializer):
@@ -21,3 +35,98 @@ class TweetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tweet
         fields = ('provider_id', 'text', 'owner', 'creation_date', 'hashtags')
+        list_serializer_class = ProfiledListSerializer
+
+
+def get_hashtag_names(tweet_ids):
+    """
+    Reads the hashtags of many tweets in one query.
+    :param tweet_ids: The primary keys of the tweets.
+    :return: A dict with the list of hashtag names of each tweet, in the order they were created.
+    """
+    links = Tweet.hashtags.through.objects.filter(tweet_id__in=tweet_ids).order_by('hashtag_id')
+    hashtags = {}
+    for tweet_id, name in links.values_list('tweet_id', 'hashtag__name'):
+        hashtags.setdefault(tweet_id, []).append(name)
+    return hashtags
+
+
+class TweetRowSerializer(object):
+    """
+    Serializing Tweets read with values(), giving the same output as TweetSerializer without building model
+    instances or going through the serializer fields of every row. The hashtags of all the rows are read in
+    a single query, and only when they're asked for.
+    """
+    fields = TweetSerializer.Meta.fields
+
+    def __init__(self, fields=None):
+        self.fields = tuple(fields or self.fields)
+        self.date_field = serializers.DateTimeField()
+
+    def get_columns(self, ordering=()):
+        """
+        Returns the columns to be read with values(): the serialized ones, the ID and the ordering fields.
+        :param ordering: The fields the rows are ordered by, e.g. the pagination ones.
+        :return: A list of field names.
+        """
+        columns = ['id'] + [field for field in self.fields if field != 'hashtags']
+        return columns + [field.lstrip('-') for field in ordering if field.lstrip('-') not in columns]
+
+    def to_representation(self, rows):
+        """
+        Serializes tweet rows.
+        :param rows: A list of dicts with the columns from get_columns().
+        :return: A list of OrderedDicts.
+        """
+        with profile_section('serialize'):
+            hashtags = get_hashtag_names([row['id'] for row in rows]) if 'hashtags' in self.fields else {}
+            to_date = self.date_field.to_representation
+            fields = self.fields
+
+            data = []
+            for row in rows:
+                item = OrderedDict()
+                for field in fields:
+                    if field == 'hashtags':
+                        item[field] = [OrderedDict([('name', name)]) for name in hashtags.get(row['id'], [])]
+                    elif field == 'creation_date':
+                        item[field] = to_date(row[field])
+                    else:
+                        item[field] = row[field]
+                data.append(item)
+            return data
+
+
+class TrendingHashtagSerializer(serializers.Serializer):
+    """
+    Serializing the usage of a trending Hashtag
+    """
+    name = serializers.CharField()
+    count = serializers.IntegerField()
+    previous_count = serializers.IntegerField()
+    growth = serializers.FloatField(allow_null=True)
+
+
+class HashtagSuggestionSerializer(serializers.Serializer):
+    """
+    Serializing a Hashtag suggested by the autocomplete, with its usage
+    """
+    name = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class HistogramBucketSerializer(serializers.Serializer):
+    """
+    Serializing the number of Tweets in a period
+    """
+    period = serializers.DateTimeField()
+    count = serializers.IntegerField()
+
+
+class FetchJobSerializer(serializers.ModelSerializer):
+    """
+    Serializing the status of a FetchJob
+    """
+    class Meta:
+        model = FetchJob
+        fields = ('id', 'handle', 'mode', 'status', 'outcome', 'message', 'created', 'modified')
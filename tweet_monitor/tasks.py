@@ -0,0 +1,93 @@
+import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+from celery import shared_task
+from social_django.models import UserSocialAuth
+
+from .ingestion import fetch_handle
+from .models import FetchJob, TrackedHandle
+from .ratelimit import RateLimited, refresh_budget
+
+# Refreshes pending or running for longer than this are considered lost, and stop counting for the budget
+REFRESH_STALE_AFTER = datetime.timedelta(hours=1)
+
+
+@shared_task(bind=True, max_retries=None)
+def fetch_handle_tweets(self, job_id, resume=None, scheduled=False):
+    """
+    Fetches the tweets of the handle from a FetchJob, updating the job with the outcome. When the Twitter
+    rate limits are reached, the job waits as pending and the task is retried once there's quota again.
+    :param job_id: The ID of the FetchJob.
+    :param resume: The arguments to continue a fetch interrupted by the rate limits.
+    :param scheduled: Whether the fetch is a scheduled refresh, whose API calls are charged to the refresh
+    budget (see refresh_tracked_handles).
+    :return: The final status of the job.
+    """
+    job = FetchJob.objects.get(pk=job_id)
+    job.status = FetchJob.STATUS_RUNNING
+    job.save(update_fields=['status', 'modified'])
+
+    try:
+        kwargs = dict({'mode': job.mode or None, 'budget': refresh_budget if scheduled else None},
+                      **(resume or {}))
+        job.outcome, job.message = fetch_handle(job.user_id, job.handle, **kwargs)
+    except RateLimited as err:
+        job.outcome = FetchJob.OUTCOME_RATE_LIMITED
+        if self.request.is_eager or self.request.called_directly:
+            # There's no worker to run the retry later
+            job.status = FetchJob.STATUS_FAILURE
+            job.message = "Twitter's rate limit was reached, please try again in a few minutes."
+            job.save(update_fields=['status', 'outcome', 'message', 'modified'])
+            return job.status
+
+        job.status = FetchJob.STATUS_PENDING
+        job.message = "Waiting for Twitter's rate limit, the fetch will go on in {:.0f} seconds.".format(err.wait)
+        job.save(update_fields=['status', 'outcome', 'message', 'modified'])
+        raise self.retry(kwargs={'job_id': job_id, 'resume': err.resume, 'scheduled': scheduled},
+                         countdown=err.wait, exc=err)
+    except Exception:
+        job.status = FetchJob.STATUS_FAILURE
+        job.outcome = FetchJob.OUTCOME_ERROR
+        job.message = "There was an unexpected problem while fetching the tweets, please try again."
+        job.save(update_fields=['status', 'outcome', 'message', 'modified'])
+        raise
+
+    job.status = FetchJob.STATUS_SUCCESS if job.outcome == FetchJob.OUTCOME_SUCCESS else FetchJob.STATUS_FAILURE
+    job.save(update_fields=['status', 'outcome', 'message', 'modified'])
+
+    return job.status
+
+
+@shared_task
+def refresh_tracked_handles():
+    """
+    Periodically enqueues refreshes of the tracked handles that are due (see TrackedHandle.schedule_refresh),
+    the most overdue first, leaving out the ones the API refused (see TrackedHandle.mark_unavailable).
+    The refreshes can make at most settings.TWEET_REFRESH_BUDGET timeline calls per interval, which also caps
+    the pages of tweets they store: each call is charged to the budget, a refresh finding it spent waits for
+    the next interval, and only as many refreshes as there are calls left are enqueued, counting one for each
+    refresh still in progress.
+    :return: The number of refreshes enqueued.
+    """
+    now = timezone.now()
+    in_progress = FetchJob.objects.filter(mode=FetchJob.MODE_REFRESH, modified__gte=now - REFRESH_STALE_AFTER,
+                                          status__in=[FetchJob.STATUS_PENDING, FetchJob.STATUS_RUNNING]).count()
+    available = refresh_budget.remaining() - in_progress
+    # The calls are spread over every user's token anyway, see tweet_monitor.ratelimit
+    user_id = UserSocialAuth.objects.filter(provider='twitter').values_list('user_id', flat=True).first()
+    if available <= 0 or user_id is None:
+        return 0
+
+    due = list(TrackedHandle.objects.filter(Q(next_fetch_at__lte=now) | Q(next_fetch_at__isnull=True))
+               .filter(unavailable=False).order_by('next_fetch_at').values_list('id', 'handle')[:available])
+    # Until the refreshes reschedule them, the handles are put off so the next runs don't enqueue them again
+    TrackedHandle.objects.filter(id__in=[handle_id for handle_id, _ in due]).update(
+        next_fetch_at=now + TrackedHandle.REFRESH_MAX_INTERVAL)
+
+    for _, handle in due:
+        job = FetchJob.objects.create(user_id=user_id, handle=handle, mode=FetchJob.MODE_REFRESH)
+        fetch_handle_tweets.delay(str(job.pk), scheduled=True)
+
+    return len(due)
@@ -1,12 +1,42 @@
+import base64
+import csv
 from datetime import datetime, timedelta
+from io import StringIO
+import json
+import time
+from types import SimpleNamespace
+from unittest import mock
+import uuid
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from django.utils.http import parse_http_date
+import requests
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIRequestFactory
+from social_django.models import UserSocialAuth
+from tweepy import TweepError
 
-from .models import Tweet, Hashtag
-from .serializers import TweetSerializer, HashtagSerializer
+from .clients import HTTP_ADAPTER, APIClientCache, api_clients
+from .export import iter_tweet_rows
+from .fake_twitter import FakeTwitterAPI
+from .filters import get_tweet_filters, plan_tweet_filters, planned_filter_tweets
+from .hashtags import extract_hashtags, extract_hashtags_batch
+from .ingestion import fetch_handle, store_statuses
+from .metrics import time_timeline_request
+from .models import FetchJob, Hashtag, HashtagDailyCount, TrackedHandle, Tweet
+from .pagination import TweetPagination
+from .ratelimit import RateLimited, RefreshBudget, TokenBuckets
+from .serializers import HashtagSerializer, TweetRowSerializer, TweetSerializer
+from .tasks import fetch_handle_tweets, refresh_tracked_handles
+from .trends import usage_day
 
 
 DEFAULT_TWEET_ID = "1234567890"
@@ -22,6 +52,31 @@ def create_tweet():
     tweet.extract_hashtags()
 
 
+def create_twitter_user(username='lucabezerra_', uid='1', token='token'):
+    """ Creates a user logged in with Twitter, whose token the API calls can use. """
+    user = get_user_model().objects.create_user(username=username, email='luca@lol.com', password='pass_word')
+    UserSocialAuth.objects.create(user=user, provider='twitter', uid=uid, extra_data={
+        'access_token': {'oauth_token': token, 'oauth_token_secret': 'secret'}})
+    return user
+
+
+def make_statuses(count, owner="lucabezerra_", first_id=1000, tag="tweet"):
+    """ Builds objects mimicking the tweepy Status objects returned by user_timeline. """
+    return [SimpleNamespace(id=first_id + i, text="Tweet number {} #test #{}{}".format(i, tag, i % 10),
+                            user=SimpleNamespace(screen_name=owner), created_at=timezone.now())
+            for i in range(count)]
+
+
+def serve_timeline(statuses):
+    """ Builds a user_timeline replacement that pages through the given statuses like the Twitter API. """
+    def user_timeline(screen_name, count, since_id=None, max_id=None):
+        page = [status for status in sorted(statuses, key=lambda status: -status.id)
+                if (not since_id or status.id > int(since_id)) and (not max_id or status.id <= int(max_id))]
+        return page[:count]
+
+    return user_timeline
+
+
 class TweetsDatabaseTests(TestCase):
     def setUp(self):
         create_tweet()
@@ -38,6 +93,986 @@ class TweetsDatabaseTests(TestCase):
         self.assertIs(len(results), 0)
 
 
+class IngestionTests(TestCase):
+    def test_statuses_are_stored_with_their_hashtags(self):
+        """ Storing statuses should save the tweets and link each of them to its hashtags. """
+        store_statuses(make_statuses(20))
+
+        self.assertEqual(Tweet.objects.count(), 20)
+        self.assertEqual(Hashtag.objects.count(), 11)
+        tweet = Tweet.objects.get(provider_id="1003")
+        self.assertEqual(sorted(h.name for h in tweet.hashtags.all()), ["#test", "#tweet3"])
+
+    def test_existing_hashtags_are_reused(self):
+        """ Hashtags already in the DB should be linked instead of duplicated. """
+        create_tweet()
+        store_statuses(make_statuses(5))
+
+        self.assertEqual(Hashtag.objects.filter(name="#test").count(), 1)
+        self.assertEqual(Tweet.objects.filter(hashtags__name="#test").count(), 6)
+
+    def test_hashtags_differing_by_case_are_the_same(self):
+        """ Hashtags should be stored once no matter their casing, keeping the first spelling for display. """
+        create_tweet()
+        store_statuses([SimpleNamespace(id=1, text="#Test and #TEST again", user=SimpleNamespace(screen_name="a"),
+                                        created_at=timezone.now())])
+
+        self.assertEqual(list(Hashtag.objects.filter(key="test").values_list('name', flat=True)), ["#test"])
+        self.assertEqual(Tweet.objects.get(provider_id="1").hashtags.count(), 1)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        """ Storing a batch of statuses should take the same number of queries regardless of its size. """
+        with self.assertNumQueries(16):
+            store_statuses(make_statuses(10))
+        # The daily count of #test already exists, so it's updated on top of the new ones being inserted
+        with self.assertNumQueries(17):
+            store_statuses(make_statuses(60, owner="someone_else", first_id=5000, tag="other"))
+        # Nothing is left to create, and the counts get different increments (25 for #test, 3 or 2 for the
+        # others) in one UPDATE per table
+        with self.assertNumQueries(10):
+            store_statuses(make_statuses(25, owner="someone_else", first_id=9000, tag="other"))
+
+        self.assertEqual(HashtagDailyCount.objects.get(hashtag__key="test").count, 95)
+        self.assertEqual(HashtagDailyCount.objects.get(hashtag__key="other4").count, 9)
+        self.assertEqual(HashtagDailyCount.objects.get(hashtag__key="other5").count, 8)
+        self.assertEqual(Hashtag.objects.get(key="test").use_count, 95)
+        self.assertEqual(Hashtag.objects.get(key="other5").use_count, 8)
+
+    def test_stored_statuses_are_skipped(self):
+        """ Storing overlapping batches should insert only the new tweets, linking and counting them once. """
+        store_statuses(make_statuses(10))
+        stored = store_statuses(make_statuses(15) + make_statuses(15)[-1:])
+
+        self.assertEqual((len(stored.tweets), stored.skipped), (5, 11))
+        self.assertEqual(Tweet.objects.count(), 15)
+        self.assertEqual(Tweet.hashtags.through.objects.count(), 30)
+        self.assertEqual(HashtagDailyCount.objects.get(hashtag__key="test").count, 15)
+
+        with self.assertNumQueries(5):
+            stored = store_statuses(make_statuses(15))
+        self.assertEqual((stored.tweets, stored.skipped), ([], 15))
+
+
+class HashtagExtractionTests(TestCase):
+    def test_punctuation_is_left_out(self):
+        """ Punctuation around a hashtag shouldn't be part of it, so the same tag is always found. """
+        self.assertEqual(extract_hashtags("#django, (#python) #django! #vinta."),
+                         ["#django", "#python", "#django", "#vinta"])
+
+    def test_twitter_rules_are_followed(self):
+        """ Numbers, anchors, entities and hashes inside words shouldn't be taken as hashtags. """
+        self.assertEqual(extract_hashtags("#123 #1st a#b &#39; #a#b #tag://x"), ["#1st"])
+
+    def test_unicode_hashtags_are_found(self):
+        """ Hashtags in other scripts, with accents or marks, and with a fullwidth hash should be found. """
+        self.assertEqual(extract_hashtags("#ação #日本語 #हिन्दी \uff03full"),
+                         ["#ação", "#日本語", "#हिन्दी", "#full"])
+
+    def test_batches_keep_each_text_apart(self):
+        """ A batch should return each text's hashtags, with none spilling over to the next text. """
+        self.assertEqual(extract_hashtags_batch(["ends with #a", "#b starts", "none", ""]),
+                         [["#a"], ["#b"], [], []])
+
+    def test_status_entities_are_preferred(self):
+        """ The hashtags parsed by Twitter should be used when the statuses include them. """
+        status = SimpleNamespace(id=1, text="A truncated tweet #dja…", user=SimpleNamespace(screen_name="a"),
+                                 created_at=timezone.now(), entities={'hashtags': [{'text': 'django'}]})
+        store_statuses([status])
+
+        self.assertEqual(list(Tweet.objects.get(provider_id="1").hashtags.values_list('name', flat=True)),
+                         ["#django"])
+
+
+class FetchJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_twitter_user()
+        self.client = Client()
+        self.client.force_login(self.user, backend='social_core.backends.twitter.TwitterOAuth')
+
+    def test_fetch_is_accepted_and_can_be_polled(self):
+        """ Asking for a handle's tweets should return a pending job, whose status can be polled. """
+        response = self.client.post('/tweets/fetch/', {'username': 'vintasoftware', 'user_id': self.user.id})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json().get("id")
+        self.assertEqual(response.json().get("status"), FetchJob.STATUS_PENDING)
+
+        response = self.client.get('/tweets/fetch/{}/'.format(job_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json().get("handle"), "vintasoftware")
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_fetch_task_stores_tweets(self, generate_tweepy_handler):
+        """ Running the fetch task should store the tweets and mark the job as successful. """
+        generate_tweepy_handler.return_value.user_timeline.side_effect = serve_timeline(make_statuses(5))
+        job = FetchJob.objects.create(user=self.user, handle="lucabezerra_")
+
+        fetch_handle_tweets(str(job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, FetchJob.STATUS_SUCCESS)
+        self.assertEqual(Tweet.objects.count(), 5)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_backfill_walks_the_whole_timeline(self, generate_tweepy_handler):
+        """ A backfill should page through the timeline until the API has no older tweets to return. """
+        user_timeline = mock.Mock(side_effect=serve_timeline(make_statuses(450)))
+        generate_tweepy_handler.return_value.user_timeline = user_timeline
+
+        outcome, message = fetch_handle(self.user.id, "lucabezerra_", FetchJob.MODE_BACKFILL)
+
+        self.assertEqual(outcome, FetchJob.OUTCOME_SUCCESS)
+        self.assertEqual(Tweet.objects.count(), 450)
+        self.assertEqual(user_timeline.call_count, 4)  # 200 + 200 + 50 + an empty page
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_refresh_only_fetches_newer_tweets(self, generate_tweepy_handler):
+        """ A refresh of a known handle should only ask for and store the tweets newer than the stored ones. """
+        statuses = make_statuses(250)
+        store_statuses(statuses[:100])
+        TrackedHandle.objects.create(key="lucabezerra_", handle="lucabezerra_", newest_id=1099, oldest_id=1000)
+        user_timeline = mock.Mock(side_effect=serve_timeline(statuses))
+        generate_tweepy_handler.return_value.user_timeline = user_timeline
+
+        outcome, message = fetch_handle(self.user.id, "lucabezerra_")
+
+        self.assertEqual(outcome, FetchJob.OUTCOME_SUCCESS)
+        self.assertIn("150 new tweets", message)
+        self.assertEqual(Tweet.objects.count(), 250)
+        self.assertEqual(user_timeline.call_args_list[0][1].get("since_id"), 1099)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_failed_refresh_is_fetched_again(self, generate_tweepy_handler):
+        """ A refresh failing after storing its first page should leave the rest of the gap to the next one. """
+        statuses = make_statuses(500)
+        store_statuses(statuses[:100])
+        TrackedHandle.objects.create(key="lucabezerra_", handle="lucabezerra_", newest_id=1099, oldest_id=1000)
+        timeline = serve_timeline(statuses)
+        server_error = TweepError("Internal error", response=SimpleNamespace(status_code=500))
+        user_timeline = mock.Mock(side_effect=[timeline(screen_name="x", count=200, since_id=1099), server_error])
+        generate_tweepy_handler.return_value.user_timeline = user_timeline
+
+        outcome, _ = fetch_handle(self.user.id, "lucabezerra_")
+
+        self.assertEqual(outcome, FetchJob.OUTCOME_ERROR)
+        self.assertEqual(Tweet.objects.count(), 300)
+        self.assertEqual(TrackedHandle.objects.get(key="lucabezerra_").newest_id, 1099)
+
+        user_timeline.side_effect = timeline
+        outcome, message = fetch_handle(self.user.id, "lucabezerra_")
+
+        self.assertEqual(outcome, FetchJob.OUTCOME_SUCCESS)
+        self.assertIn("200 new tweets", message)
+        self.assertEqual(Tweet.objects.count(), 500)
+        self.assertEqual(user_timeline.call_args_list[2][1].get("since_id"), 1099)
+        self.assertEqual(TrackedHandle.objects.get(key="lucabezerra_").newest_id, 1499)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_fetching_stored_tweets_again_skips_them(self, generate_tweepy_handler):
+        """ Fetching tweets that were already stored should add the others and report the skipped ones. """
+        statuses = make_statuses(50)
+        store_statuses(statuses[10:30])
+        generate_tweepy_handler.return_value.user_timeline.side_effect = serve_timeline(statuses)
+
+        outcome, message = fetch_handle(self.user.id, "lucabezerra_")
+
+        self.assertEqual(outcome, FetchJob.OUTCOME_SUCCESS)
+        self.assertEqual(message, "30 new tweets from @lucabezerra_ were added successfully! "
+                                  "20 already stored were skipped.")
+        self.assertEqual(Tweet.objects.count(), 50)
+        self.assertEqual(TrackedHandle.objects.get(key="lucabezerra_").tweet_count, 30)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_fetch_keeps_track_of_the_handle(self, generate_tweepy_handler):
+        """ Fetching a handle should record its tweet count and newest/oldest tweet IDs. """
+        generate_tweepy_handler.return_value.user_timeline.side_effect = serve_timeline(make_statuses(30))
+
+        fetch_handle(self.user.id, "@LucaBezerra_")
+
+        tracked = TrackedHandle.objects.get(key="lucabezerra_")
+        self.assertEqual(tracked.handle, "lucabezerra_")
+        self.assertEqual((tracked.tweet_count, tracked.newest_id, tracked.oldest_id), (30, 1029, 1000))
+        self.assertIsNotNone(tracked.last_fetched_at)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_fetch_task_of_unknown_handle_fails(self, generate_tweepy_handler):
+        """ Running the fetch task for a handle that doesn't exist should mark the job as failed. """
+        error = TweepError("Not found", response=SimpleNamespace(status_code=404))
+        generate_tweepy_handler.return_value.user_timeline.side_effect = error
+        job = FetchJob.objects.create(user=self.user, handle="whatever")
+
+        fetch_handle_tweets(str(job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, FetchJob.STATUS_FAILURE)
+        self.assertIn("doesn't exist", job.message)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_bulk_fetch_summarizes_each_handle(self, generate_tweepy_handler):
+        """ Fetching several handles at once should report the outcome of each of them. """
+        timelines = {"lucabezerra_": serve_timeline(make_statuses(5))}
+        errors = {"whatever": 404, "private": 401}
+
+        def user_timeline(screen_name, **kwargs):
+            if screen_name in errors:
+                raise TweepError("Error", response=SimpleNamespace(status_code=errors[screen_name]))
+            return timelines[screen_name](screen_name=screen_name, **kwargs)
+
+        generate_tweepy_handler.return_value.user_timeline.side_effect = user_timeline
+
+        response = self.client.post('/tweets/fetch/', {'usernames': ['lucabezerra_', '@whatever, private LucaBezerra_'],
+                                                       'user_id': self.user.id})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["summary"], {"pending": 3})
+        self.assertEqual(FetchJob.objects.count(), 3)
+
+        for job in FetchJob.objects.all():
+            fetch_handle_tweets(str(job.pk))
+
+        response = self.client.get(response["Location"])
+        self.assertEqual(response.json()["summary"], {"not_found": 1, "protected": 1, "success": 1})
+        self.assertEqual([(job["handle"], job["outcome"]) for job in response.json()["jobs"]],
+                         [("lucabezerra_", "success"), ("private", "protected"), ("whatever", "not_found")])
+        self.assertEqual(Tweet.objects.count(), 5)
+
+    def test_unknown_batch(self):
+        """ Polling a batch that doesn't exist should return a 404. """
+        self.assertEqual(self.client.get('/tweets/fetch/batch/{}/'.format(uuid.uuid4())).status_code, 404)
+        self.assertEqual(self.client.get('/tweets/fetch/batch/abc/').status_code, 404)
+        self.assertEqual(self.client.get('/tweets/fetch/batch/{}-0/'.format(uuid.uuid4())).status_code, 404)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [create_twitter_user('user' + uid, uid, 'token' + uid) for uid in ('1', '2')]
+
+    def test_buckets_follow_the_rate_limit_headers(self):
+        """ A token should be usable until the calls reported as remaining are taken, then until its reset. """
+        buckets = TokenBuckets()
+        reset = int(time.time()) + 60
+        buckets.update(self.users[0].id, {'x-rate-limit-remaining': '1', 'x-rate-limit-reset': str(reset)})
+
+        self.assertEqual(buckets.acquire(self.users[0].id), 0)
+        self.assertAlmostEqual(buckets.acquire(self.users[0].id), 60, delta=2)
+        self.assertEqual(buckets.acquire(self.users[1].id), 0)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_calls_move_to_tokens_with_quota(self, generate_tweepy_handler):
+        """ When the user's token is out of quota, another user's token should be used. """
+        apis = {'token1': mock.Mock(), 'token2': mock.Mock()}
+        generate_tweepy_handler.side_effect = lambda token, secret: apis[token]
+        apis['token2'].user_timeline.side_effect = serve_timeline(make_statuses(5))
+        TokenBuckets().exhaust(self.users[0].id)
+
+        outcome, message = fetch_handle(self.users[0].id, "lucabezerra_")
+
+        self.assertEqual(outcome, FetchJob.OUTCOME_SUCCESS)
+        self.assertFalse(apis['token1'].user_timeline.called)
+        self.assertEqual(Tweet.objects.count(), 5)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_refused_calls_delay_the_fetch(self, generate_tweepy_handler):
+        """ After a 429 on every token, the fetch should stop with what's needed to resume the refresh. """
+        statuses = make_statuses(300)
+        TrackedHandle.objects.create(key="lucabezerra_", handle="lucabezerra_", newest_id=900, oldest_id=800)
+        timeline = serve_timeline(statuses)
+        refused = TweepError("Rate limit exceeded", response=SimpleNamespace(
+            status_code=429, headers={'x-rate-limit-reset': str(int(time.time()) + 300)}))
+        generate_tweepy_handler.return_value.user_timeline.side_effect = [timeline(count=200, screen_name="x"),
+                                                                          refused, refused]
+
+        with self.assertRaises(RateLimited) as context:
+            fetch_handle(self.users[0].id, "lucabezerra_")
+
+        self.assertEqual(Tweet.objects.count(), 200)
+        self.assertAlmostEqual(context.exception.wait, 300, delta=2)
+        self.assertEqual(context.exception.resume, {'mode': FetchJob.MODE_REFRESH, 'since_id': 900, 'max_id': 1099,
+                                                    'newest_id': 1299})
+        self.assertEqual(TrackedHandle.objects.get(key="lucabezerra_").newest_id, 900)
+
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_rate_limited_job_is_not_a_generic_failure(self, generate_tweepy_handler):
+        """ Without a worker to retry it, a rate limited job should say so instead of blaming the handle. """
+        for user in self.users:
+            TokenBuckets().exhaust(user.id)
+        job = FetchJob.objects.create(user=self.users[0], handle="lucabezerra_")
+
+        fetch_handle_tweets(str(job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, FetchJob.STATUS_FAILURE)
+        self.assertIn("rate limit", job.message)
+        self.assertFalse(generate_tweepy_handler.return_value.user_timeline.called)
+
+
+class RefreshSchedulingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_twitter_user()
+
+    def track(self, key, tweets_per_day, next_fetch_at=None):
+        statuses = make_statuses(20, owner=key, first_id=TrackedHandle.objects.count() * 100)
+        for status in statuses:
+            status.created_at = timezone.now() - timedelta(days=20 / tweets_per_day)
+        store_statuses(statuses)
+        return TrackedHandle.objects.create(key=key, handle=key, tweet_count=20, next_fetch_at=next_fetch_at)
+
+    def test_busy_handles_are_refreshed_more_often(self):
+        """ The next refresh should come sooner for handles posting more, within the bounds. """
+        busy, regular, dormant = self.track("busy", 5000), self.track("regular", 24), self.track("dormant", 0.1)
+        for tracked in (busy, regular, dormant):
+            tracked.schedule_refresh()
+
+        self.assertEqual(busy.next_fetch_at - busy.last_fetched_at, TrackedHandle.REFRESH_MIN_INTERVAL)
+        self.assertAlmostEqual((regular.next_fetch_at - regular.last_fetched_at).total_seconds(), 20 * 3600, delta=60)
+        self.assertEqual(dormant.next_fetch_at - dormant.last_fetched_at, TrackedHandle.REFRESH_MAX_INTERVAL)
+
+    @mock.patch('tweet_monitor.tasks.fetch_handle_tweets.delay')
+    def test_due_handles_are_refreshed_within_the_budget(self, delay):
+        """ The most overdue handles should be enqueued first, up to the budget, and not enqueued twice. """
+        now = timezone.now()
+        self.track("late", 24, now - timedelta(hours=2))
+        self.track("later", 24, now - timedelta(hours=5))
+        self.track("on_time", 24, now - timedelta(minutes=1))
+        self.track("not_due", 24, now + timedelta(hours=1))
+
+        with self.settings(TWEET_REFRESH_BUDGET=2):
+            self.assertEqual(refresh_tracked_handles(), 2)
+            delay.assert_called_with(mock.ANY, scheduled=True)
+            self.assertEqual(refresh_tracked_handles(), 0)  # the budget is taken by the pending refreshes
+
+        self.assertEqual(sorted(FetchJob.objects.values_list('handle', flat=True)), ["late", "later"])
+        self.assertEqual(delay.call_count, 2)
+
+        FetchJob.objects.update(status=FetchJob.STATUS_SUCCESS)
+        with self.settings(TWEET_REFRESH_BUDGET=2):
+            self.assertEqual(refresh_tracked_handles(), 1)
+        self.assertTrue(FetchJob.objects.filter(handle="on_time", mode=FetchJob.MODE_REFRESH).exists())
+
+    @mock.patch('tweet_monitor.tasks.fetch_handle_tweets.delay')
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_unknown_handles_are_not_refreshed(self, generate_tweepy_handler, delay):
+        """ A handle the API doesn't find should be dropped, or left out of the refreshes if it has tweets. """
+        generate_tweepy_handler.return_value.user_timeline.side_effect = TweepError(
+            "Not found", response=SimpleNamespace(status_code=404))
+        self.track("deleted", 24, timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(fetch_handle(self.user.id, "typo_handle")[0], FetchJob.OUTCOME_NOT_FOUND)
+        self.assertEqual(fetch_handle(self.user.id, "deleted")[0], FetchJob.OUTCOME_NOT_FOUND)
+
+        self.assertFalse(TrackedHandle.objects.filter(key="typo_handle").exists())
+        deleted = TrackedHandle.objects.get(key="deleted")
+        self.assertEqual((deleted.unavailable, deleted.next_fetch_at, deleted.tweet_count), (True, None, 20))
+        self.assertEqual(refresh_tracked_handles(), 0)
+        self.assertFalse(delay.called)
+
+    @mock.patch('tweet_monitor.tasks.fetch_handle_tweets.delay')
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_protected_handles_are_not_refreshed(self, generate_tweepy_handler, delay):
+        """ A protected handle should be left out of the refreshes until a fetch of it succeeds again. """
+        user_timeline = generate_tweepy_handler.return_value.user_timeline
+        user_timeline.side_effect = TweepError("Not authorized", response=SimpleNamespace(status_code=401))
+
+        self.assertEqual(fetch_handle(self.user.id, "protected")[0], FetchJob.OUTCOME_PROTECTED)
+
+        tracked = TrackedHandle.objects.get(key="protected")
+        self.assertEqual((tracked.unavailable, tracked.next_fetch_at), (True, None))
+        self.assertEqual(refresh_tracked_handles(), 0)
+        self.assertFalse(delay.called)
+
+        user_timeline.side_effect = serve_timeline(make_statuses(5, owner="protected"))
+        self.assertEqual(fetch_handle(self.user.id, "protected")[0], FetchJob.OUTCOME_SUCCESS)
+        tracked.refresh_from_db()
+        self.assertFalse(tracked.unavailable)
+        self.assertIsNotNone(tracked.next_fetch_at)
+
+    @mock.patch('tweet_monitor.tasks.fetch_handle_tweets.delay')
+    @mock.patch('tweet_monitor.clients.generate_tweepy_handler')
+    def test_refreshes_are_charged_per_api_call(self, generate_tweepy_handler, delay):
+        """ A refresh should stop when the calls of the interval are spent, and no other should be enqueued. """
+        generate_tweepy_handler.return_value.user_timeline.side_effect = serve_timeline(
+            make_statuses(300, owner="busy"))
+        TrackedHandle.objects.create(key="busy", handle="busy", newest_id=999, oldest_id=900)
+        self.track("late", 24, timezone.now() - timedelta(hours=2))
+
+        with self.settings(TWEET_REFRESH_BUDGET=2, TWEET_REFRESH_INTERVAL=3600):
+            # Two pages of 200 and 100 tweets, then the call that would find no newer ones is held back
+            with self.assertRaises(RateLimited) as context:
+                fetch_handle(self.user.id, "busy", budget=RefreshBudget())
+            self.assertEqual(refresh_tracked_handles(), 0)
+
+        self.assertEqual(Tweet.objects.filter(owner_key="busy").count(), 300)
+        self.assertEqual(context.exception.resume["max_id"], 999)
+        self.assertFalse(delay.called)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        store_statuses(make_statuses(25))
+        self.client = Client()
+
+    def test_pages_follow_the_cursor(self):
+        """ Following the next links should go through every tweet exactly once, newest first. """
+        url, provider_ids = '/tweets/filters/user/lucabezerra_/?page_size=10', []
+        while url:
+            data = self.client.get(url).json()
+            provider_ids.extend(tweet["provider_id"] for tweet in data["results"])
+            url = data["next"]
+
+        self.assertEqual(len(provider_ids), 25)
+        self.assertEqual(set(provider_ids), set(Tweet.objects.values_list('provider_id', flat=True)))
+        dates = list(Tweet.objects.order_by('-creation_date', '-id').values_list('provider_id', flat=True))
+        self.assertEqual(provider_ids, dates)
+
+    def test_previous_link_goes_back_one_page(self):
+        """ The previous link of the second page should lead back to the first page. """
+        first_page = self.client.get('/tweets/filters/user/lucabezerra_/?page_size=10').json()
+        second_page = self.client.get(first_page["next"]).json()
+        back = self.client.get(second_page["previous"]).json()
+
+        self.assertIsNone(first_page["previous"])
+        self.assertEqual(back["results"], first_page["results"])
+
+    def test_pages_do_not_count_or_offset(self):
+        """ Deep pages should be fetched with a keyset filter, without COUNT(*) or OFFSET. """
+        first_page = self.client.get('/tweets/filters/user/lucabezerra_/?page_size=10').json()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(first_page["next"])
+
+        sql = " ".join(query["sql"] for query in context.captured_queries).upper()
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    def test_invalid_cursor(self):
+        """ A cursor that can't be decoded should be answered with a 404. """
+        response = self.client.get('/tweets/filters/user/lucabezerra_/?cursor=whatever')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_invalid_values(self):
+        """ A well-formed cursor whose values don't fit the ordering fields should be answered with a 404. """
+        cursors = [
+            ('/tweets/filters/user/lucabezerra_/', ["bad", 1]),
+            ('/tweets/filters/user/lucabezerra_/', [timezone.now().isoformat(), "bad"]),
+            ('/tweets/filters/user/lucabezerra_/', [None, 1]),
+            ('/tweets/list_hashtags/', [[1]]),
+            ('/tweets/filters/text/number/', ["bad", 1]),
+        ]
+        for url, position in cursors:
+            cursor = base64.urlsafe_b64encode(json.dumps({"r": 0, "p": position}).encode('utf-8')).decode('ascii')
+            response = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, (url, position))
+
+
+class QueryBudgetTests(TestCase):
+    """ Every list endpoint should take a fixed number of queries, however many tweets are stored. """
+    # Number of queries of each endpoint: the page of tweets and the hashtags of the whole page, plus the
+    # ranked search for the text filter
+    TWEET_ENDPOINTS = [
+        ('/tweets/filters/user/lucabezerra_/', 2),
+        ('/tweets/filters/date/2000-01-01/', 2),
+        ('/tweets/filters/text/number/', 3),
+        ('/tweets/filters/hashtag/test/', 2),
+    ]
+    HASHTAG_QUERY_BUDGET = 1
+
+    def assertQueryBudget(self, tweet_count):
+        store_statuses(make_statuses(tweet_count))
+        client = Client()
+
+        for url, query_budget in self.TWEET_ENDPOINTS:
+            with self.assertNumQueries(query_budget):
+                response = client.get(url)
+            self.assertEqual(len(response.json()["results"]), min(tweet_count, TweetPagination.page_size))
+            self.assertEqual(len(response.json()["results"][0]["hashtags"]), 2)
+
+        with self.assertNumQueries(self.HASHTAG_QUERY_BUDGET):
+            client.get('/tweets/list_hashtags/')
+
+    def test_query_budget_with_10_tweets(self):
+        self.assertQueryBudget(10)
+
+    def test_query_budget_with_1000_tweets(self):
+        self.assertQueryBudget(1000)
+
+    def test_query_budget_with_10000_tweets(self):
+        self.assertQueryBudget(10000)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        store_statuses([
+            SimpleNamespace(id=1, text="Django and React, Django everywhere", user=SimpleNamespace(screen_name="a"),
+                            created_at=timezone.now()),
+            SimpleNamespace(id=2, text="Learning Django today", user=SimpleNamespace(screen_name="b"),
+                            created_at=timezone.now()),
+            SimpleNamespace(id=3, text="React hooks", user=SimpleNamespace(screen_name="c"),
+                            created_at=timezone.now()),
+        ])
+        self.client = Client()
+
+    def search(self, query):
+        results = self.client.get('/tweets/filters/text/{}/'.format(query)).json()["results"]
+        return [tweet["provider_id"] for tweet in results]
+
+    def test_results_are_ranked(self):
+        """ Tweets where the words appear more often should come first. """
+        self.assertEqual(self.search("django"), ["1", "2"])
+
+    def test_every_term_must_match(self):
+        """ Searching for several words should only find the tweets containing all of them. """
+        self.assertEqual(self.search("react django"), ["1"])
+        self.assertEqual(self.search("REACT"), ["3", "1"])  # same rank, newest first
+
+    def test_tweets_saved_one_by_one_are_searchable(self):
+        """ Tweets saved outside the ingestion should be indexed as well. """
+        create_tweet()
+        self.assertEqual(self.search("test tweet"), [DEFAULT_TWEET_ID])
+
+    def test_search_pages(self):
+        """ The next link should continue from the last result of the page. """
+        first_page = self.client.get('/tweets/filters/text/django/?page_size=1').json()
+        second_page = self.client.get(first_page["next"]).json()
+
+        self.assertEqual([tweet["provider_id"] for tweet in second_page["results"]], ["2"])
+        self.assertIsNone(second_page["next"])
+
+
+class APIClientCacheTests(TestCase):
+    def setUp(self):
+        self.user = create_twitter_user()
+        self.auth = self.user.social_auth.get(provider='twitter')
+        self.clients = APIClientCache(max_size=1)
+
+    def test_clients_are_reused(self):
+        """ Getting a user's client again should neither read the credentials nor build a new client. """
+        client = self.clients.get(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertIs(self.clients.get(self.user.id), client)
+
+    def test_clients_are_rebuilt_when_tokens_change(self):
+        """ Saving new credentials should replace the cached client. """
+        client = self.clients.get(self.user.id)
+        self.auth.extra_data['access_token']['oauth_token'] = 'new_token'
+        self.auth.save()
+
+        new_client = self.clients.get(self.user.id)
+        self.assertIsNot(new_client, client)
+        self.assertEqual(new_client.auth.access_token, 'new_token')
+
+    def test_least_recently_used_clients_are_evicted(self):
+        """ The cache shouldn't grow past its size. """
+        other_user = create_twitter_user('other', '2', 'other')
+
+        client = self.clients.get(self.user.id)
+        self.clients.get(other_user.id)
+        self.assertIsNot(self.clients.get(self.user.id), client)
+
+    def test_calls_share_the_connection_pool(self):
+        """ Every call should go through the shared adapter, with only the API parameters. """
+        response = requests.Response()
+        response.status_code, response._content = 200, b'[]'
+        with mock.patch.object(HTTP_ADAPTER, 'send', return_value=response) as send:
+            self.assertEqual(self.clients.get(self.user.id).user_timeline(screen_name='vintasoftware'), [])
+
+        self.assertIn('screen_name=vintasoftware', send.call_args[0][0].url)
+        self.assertNotIn('create', send.call_args[0][0].url)
+
+
+@override_settings(TWITTER_API_BACKEND='tweet_monitor.fake_twitter.FakeTwitterAPI',
+                   FAKE_TWITTER={'TIMELINE_SIZE': 450, 'HASHTAG_DENSITY': 1.5})
+class FakeTwitterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        api_clients.clear()
+        self.user = create_twitter_user()
+
+    def tearDown(self):
+        api_clients.clear()
+
+    def test_timelines_are_paged_like_the_api(self):
+        """ The whole synthetic timeline should be backfilled, and a refresh should find nothing new. """
+        self.assertEqual(fetch_handle(self.user.id, 'vintasoftware')[0], FetchJob.OUTCOME_SUCCESS)
+        self.assertEqual(Tweet.objects.filter(owner_key='vintasoftware').count(), 450)
+        self.assertEqual(fetch_handle(self.user.id, 'vintasoftware')[1],
+                         "0 new tweets from @vintasoftware were added successfully!")
+
+    def test_timelines_are_deterministic(self):
+        """ The same handle should always get the same tweets, with about the configured hashtag density. """
+        first_page = FakeTwitterAPI().user_timeline(screen_name='vintasoftware', count=200)
+        self.assertEqual([(status.id, status.text) for status in first_page],
+                         [(status.id, status.text) for status in
+                          FakeTwitterAPI().user_timeline(screen_name='vintasoftware', count=200)])
+        self.assertAlmostEqual(sum(status.text.count('#') for status in first_page) / 200, 1.5, delta=0.15)
+
+    def test_errors_are_injected(self):
+        """ Special handles should fail like missing or protected accounts, and the error rate should apply. """
+        self.assertEqual(fetch_handle(self.user.id, 'notfound')[0], FetchJob.OUTCOME_NOT_FOUND)
+        self.assertEqual(fetch_handle(self.user.id, 'protected')[0], FetchJob.OUTCOME_PROTECTED)
+        with self.assertRaises(TweepError):
+            FakeTwitterAPI(ERROR_RATE=1).user_timeline(screen_name='vintasoftware')
+
+    def test_benchmark_leaves_the_db_untouched(self):
+        """ The benchmark should report its measurements and roll back what it stored. """
+        out = StringIO()
+        call_command('benchmark_ingestion', handles=2, timeline_size=300, stdout=out)
+
+        self.assertIn("Tweets stored: 600", out.getvalue())
+        self.assertIn("tweets/s", out.getvalue())
+        self.assertEqual(Tweet.objects.count(), 0)
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        store_statuses(make_statuses(30) + make_statuses(5, owner="someone_else", first_id=2000))
+        self.client = Client()
+
+    def export(self, query):
+        response = self.client.get('/tweets/export/?' + query)
+        return response, b"".join(response.streaming_content).decode("utf-8")
+
+    def test_export_ndjson(self):
+        """ The export should stream one JSON object per tweet, with the same fields as the API. """
+        response, content = self.export("user=LucaBezerra_")
+        lines = [json.loads(line) for line in content.splitlines()]
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len(lines), 30)
+        self.assertEqual(lines[3], TweetSerializer(Tweet.objects.get(provider_id="1003")).data)
+
+    def test_export_csv_with_filters(self):
+        """ The CSV export should have a header line and apply the hashtag and text filters together. """
+        response, content = self.export("format=csv&hashtag=tweet3&text=number")
+        rows = list(csv.reader(content.splitlines()))
+
+        self.assertEqual(rows[0], ["provider_id", "text", "owner", "creation_date", "hashtags"])
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ["1003", "1013", "1023", "2003"])
+        self.assertEqual(rows[1][4], "#test #tweet3")
+
+    def test_export_reads_in_chunks(self):
+        """ Each chunk should cost the same two queries, whatever the export size. """
+        with CaptureQueriesContext(connection) as context:
+            list(iter_tweet_rows(Tweet.objects.all(), chunk_size=10))
+
+        # 4 chunks of tweets and their hashtags, plus the empty read that ends the export
+        self.assertEqual(len(context.captured_queries), 9)
+
+    def test_export_rejects_invalid_parameters(self):
+        """ Unknown formats and invalid dates should be refused. """
+        response = self.client.get('/tweets/export/?format=xml')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"format": "Invalid format, use one of: csv, ndjson."})
+        response = self.client.get('/tweets/export/?start=yesterday')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()), ["start"])
+
+
+class TrendsTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+
+    def daily_count(self, name):
+        return HashtagDailyCount.objects.get(hashtag__key=name, day=usage_day(timezone.now())).count
+
+    def test_daily_counts_are_incremented(self):
+        """ Ingesting tweets, in batches or one by one, should add their hashtags to the counts of the day. """
+        store_statuses(make_statuses(20))
+        self.assertEqual(self.daily_count("test"), 20)
+        self.assertEqual(self.daily_count("tweet3"), 2)
+
+        store_statuses(make_statuses(5, first_id=2000))
+        create_tweet()
+        self.assertEqual(self.daily_count("test"), 26)
+        self.assertEqual(self.daily_count("tweet3"), 3)
+
+    def test_trending_hashtags(self):
+        """ The most used hashtags in the window should come first, compared to the window before. """
+        ten_days_ago = timezone.now() - timedelta(days=10)
+        store_statuses([SimpleNamespace(id=i, text=text, user=SimpleNamespace(screen_name="a"), created_at=created_at)
+                        for i, (text, created_at) in enumerate([
+                            ("#django #python", timezone.now()),
+                            ("#django", timezone.now()),
+                            ("#python #react", ten_days_ago),
+                            ("#python", ten_days_ago),
+                            ("#react #old", timezone.now() - timedelta(days=30)),
+                        ])])
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/tweets/trending_hashtags/?days=7&limit=2')
+
+        self.assertEqual(response.json(), [
+            {"name": "#django", "count": 2, "previous_count": 0, "growth": None},
+            {"name": "#python", "count": 1, "previous_count": 2, "growth": -0.5},
+        ])
+
+    def test_trending_hashtags_invalid_parameters(self):
+        """ Windows and limits out of bounds should be refused. """
+        self.assertEqual(self.client.get('/tweets/trending_hashtags/?days=0').status_code, 400)
+        self.assertEqual(self.client.get('/tweets/trending_hashtags/?limit=lots').status_code, 400)
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_hashtags_are_autocompleted_by_usage(self):
+        """ The hashtags starting with a prefix should be suggested from the most used, whatever the case. """
+        store_statuses([SimpleNamespace(id=i, text=text, user=SimpleNamespace(screen_name="a"),
+                                        created_at=timezone.now())
+                        for i, text in enumerate(["#Django #python", "#djangocon #django", "#djangocon",
+                                                  "#djangocon", "#dj"])])
+        create_tweet()
+        self.assertEqual(Hashtag.objects.get(key="django").use_count, 2)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/tweets/hashtags/autocomplete/?q=%23DJANGO&limit=2')
+        self.assertEqual(response.json(), [{"name": "#djangocon", "count": 3}, {"name": "#Django", "count": 2}])
+        with self.assertNumQueries(0):
+            self.client.get('/tweets/hashtags/autocomplete/?q=%23DJANGO&limit=2')
+
+        self.assertEqual(len(self.client.get('/tweets/hashtags/autocomplete/?q=dj').json()), 3)
+        self.assertEqual(self.client.get('/tweets/hashtags/autocomplete/?q=x').json(), [])
+        self.assertEqual(self.client.get('/tweets/hashtags/autocomplete/?limit=1000').status_code, 400)
+
+
+class DateRangeTests(TestCase):
+    def setUp(self):
+        def status(provider_id, owner, created_at, text="Some tweet #test"):
+            return SimpleNamespace(id=provider_id, text=text, user=SimpleNamespace(screen_name=owner),
+                                   created_at=created_at)
+
+        self.day = timezone.make_aware(datetime(2017, 6, 5))  # a Monday
+        store_statuses([
+            status(1, "a", self.day - timedelta(days=1)),
+            status(2, "a", self.day + timedelta(hours=1)),
+            status(3, "b", self.day + timedelta(hours=1, minutes=30), text="Another tweet"),
+            status(4, "a", self.day + timedelta(days=1, hours=5)),
+            status(5, "a", self.day + timedelta(days=8)),
+        ])
+        self.client = Client()
+
+    def provider_ids(self, url):
+        return sorted(tweet["provider_id"] for tweet in self.client.get(url).json()["results"])
+
+    def test_list_tweets_in_date_range(self):
+        """ The start should be inclusive, and an end given as a date should include that whole day. """
+        self.assertEqual(self.provider_ids('/tweets/filters/date/?start=2017-06-05&end=2017-06-06'), ["2", "3", "4"])
+        self.assertEqual(self.provider_ids('/tweets/filters/date/?end=2017-06-05'), ["1", "2", "3"])
+        self.assertEqual(self.provider_ids('/tweets/filters/date/2017-06-06/'), ["4", "5"])
+
+    def test_list_tweets_in_invalid_date_range(self):
+        """ Invalid dates and ranges ending before they start should be refused. """
+        self.assertEqual(self.client.get('/tweets/filters/date/?start=someday').status_code, 400)
+        self.assertEqual(self.client.get('/tweets/filters/date/?start=2017-06-06&end=2017-06-01').status_code, 400)
+
+    def test_daily_histogram(self):
+        """ Tweets should be counted per day, including the days without any, in a single query. """
+        with self.assertNumQueries(1):
+            response = self.client.get('/tweets/histogram/?interval=day&start=2017-06-04&end=2017-06-07')
+
+        self.assertEqual([bucket["count"] for bucket in response.json()], [1, 2, 1, 0])
+        self.assertEqual(response.json()[1]["period"], serializers.DateTimeField().to_representation(self.day))
+
+    def test_hourly_histogram_by_owner(self):
+        """ The histogram should accept the same filters as the tweet lists. """
+        response = self.client.get('/tweets/histogram/?interval=hour&user=A&start=2017-06-05&end=2017-06-05T03:00')
+        self.assertEqual([bucket["count"] for bucket in response.json()], [0, 1, 0])
+
+    def test_weekly_histogram_by_hashtag(self):
+        """ Weeks should start on Mondays. """
+        response = self.client.get('/tweets/histogram/?interval=week&hashtag=test&start=2017-06-01&end=2017-06-18')
+        self.assertEqual([bucket["count"] for bucket in response.json()], [1, 2, 1])
+        self.assertEqual(response.json()[0]["period"],
+                         serializers.DateTimeField().to_representation(self.day - timedelta(days=7)))
+
+    def test_histogram_is_bounded(self):
+        """ Unknown intervals and ranges with too many buckets should be refused. """
+        self.assertEqual(self.client.get('/tweets/histogram/?interval=minute').status_code, 400)
+        self.assertEqual(self.client.get('/tweets/histogram/?interval=hour&start=2000-01-01').status_code, 400)
+
+
+class CompoundFilterTests(TestCase):
+    def setUp(self):
+        store_statuses(make_statuses(30) + make_statuses(30, owner="someone_else", first_id=2000))
+        self.client = Client()
+
+    def provider_ids(self, query):
+        response = self.client.get('/tweets/filters/?' + query)
+        return sorted(tweet["provider_id"] for tweet in response.json()["results"])
+
+    def test_filters_are_combined(self):
+        """ Tweets should match every given filter. """
+        self.assertEqual(self.provider_ids("user=lucabezerra_&hashtag=tweet3"), ["1003", "1013", "1023"])
+        self.assertEqual(self.provider_ids("user=lucabezerra_&hashtag=tweet3&text=number 13"), ["1013"])
+        self.assertEqual(self.provider_ids("hashtag=%23tweet3&start=2000-01-01&text=number"),
+                         ["1003", "1013", "1023", "2003", "2013", "2023"])
+
+    def test_most_selective_filter_comes_first(self):
+        """ The rarest filter should lead the query, as a subquery over its own index. """
+        TrackedHandle.objects.create(key="lucabezerra_", handle="lucabezerra_", tweet_count=30)
+        plan = plan_tweet_filters(get_tweet_filters({"user": "lucabezerra_", "hashtag": "tweet3", "text": "test"}))
+        self.assertEqual(plan, [("hashtag", 6), ("user", 30), ("text", 60)])
+
+        queryset = planned_filter_tweets(Tweet.objects.all(), {"user": "lucabezerra_", "hashtag": "tweet3"})
+        self.assertIn("IN (SELECT", str(queryset.query))
+
+    def test_filters_matching_nothing_skip_the_query(self):
+        """ Unknown hashtags or words should return an empty page without querying the tweets. """
+        with self.assertNumQueries(1):
+            self.assertEqual(self.provider_ids("user=lucabezerra_&hashtag=unknown"), [])
+        with self.assertNumQueries(2):
+            self.assertEqual(self.provider_ids("user=lucabezerra_&hashtag=test&text=unknown"), [])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        store_statuses(make_statuses(3))
+        self.client = Client()
+
+    @override_settings(REQUEST_PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_profiled(self):
+        """ A profiled request should report its timings and queries in the headers and in the logs. """
+        with self.assertLogs('common.profiling', 'INFO') as logs:
+            response = self.client.get('/tweets/filters/')
+
+        timings = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        self.assertEqual(sorted(timings), ['db', 'render', 'serialize', 'total', 'view'])
+        self.assertIn('desc="2 queries"', timings['db'])
+        self.assertIn("status=200 queries=2 total_ms=", logs.output[0])
+        self.assertIn("request_id=none", logs.output[0])
+
+    def test_requests_out_of_the_sample_are_not_profiled(self):
+        """ No request should be profiled when the sample rate is 0. """
+        self.assertNotIn('Server-Timing', self.client.get('/tweets/filters/'))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def get_samples(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return dict(line.rsplit(' ', 1) for line in response.content.decode().splitlines()
+                    if not line.startswith('#'))
+
+    def test_ingestion_is_counted(self):
+        """ Storing tweets should count them, their hashtag links and the size of the insert batches. """
+        store_statuses(make_statuses(30))
+        store_statuses(make_statuses(40))
+        FetchJob.objects.create(handle="vintasoftware")
+
+        samples = self.get_samples()
+        self.assertEqual(samples['tweet_monitor_tweets_ingested_total'], '40')
+        self.assertEqual(samples['tweet_monitor_tweets_skipped_total'], '30')
+        self.assertEqual(samples['tweet_monitor_hashtag_links_total'], '80')
+        self.assertEqual(samples['tweet_monitor_write_batch_size_bucket{table="tweets",le="10"}'], '1')
+        self.assertEqual(samples['tweet_monitor_write_batch_size_bucket{table="tweets",le="50"}'], '2')
+        self.assertEqual(samples['tweet_monitor_write_batch_size_sum{table="tweets"}'], '40.0')
+        self.assertEqual(samples['tweet_monitor_fetch_jobs{status="pending"}'], '1')
+
+    def test_timeline_calls_are_timed(self):
+        """ The user_timeline calls should be timed, and their errors counted by status code. """
+        with self.assertRaises(TweepError):
+            with time_timeline_request():
+                raise TweepError("Not found", response=SimpleNamespace(status_code=404))
+        with time_timeline_request():
+            pass
+
+        samples = self.get_samples()
+        self.assertEqual(samples['tweet_monitor_timeline_request_seconds_count'], '2')
+        self.assertEqual(samples['tweet_monitor_timeline_request_seconds_bucket{le="0.1"}'], '2')
+        self.assertEqual(samples['tweet_monitor_timeline_errors_total{status="404"}'], '1')
+        self.assertEqual(samples['tweet_monitor_timeline_errors_total{status="429"}'], '0')
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        store_statuses(make_statuses(3))
+        self.client = Client()
+
+    def test_responses_are_cached(self):
+        """ Asking again for the same filter should not touch the DB. """
+        first = self.client.get('/tweets/filters/user/lucabezerra_/').json()
+        with self.assertNumQueries(0):
+            second = self.client.get('/tweets/filters/user/lucabezerra_/').json()
+        with self.assertNumQueries(2):
+            self.client.get('/tweets/filters/user/lucabezerra_/?page_size=1')  # different parameters
+
+        self.assertEqual(first, second)
+
+    def test_unchanged_lists_are_not_modified(self):
+        """ Polling with the validators of a list should get a 304 without any query until it changes. """
+        etag = self.client.get('/tweets/filters/user/lucabezerra_/')['ETag']
+        last_modified = self.client.get('/tweets/list_hashtags/')['Last-Modified']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/tweets/filters/user/lucabezerra_/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/tweets/list_hashtags/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code,
+                         304)
+
+        store_statuses(make_statuses(1, first_id=5000))
+        response = self.client.get('/tweets/filters/user/lucabezerra_/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()["results"]), 4)
+
+    def test_changes_within_a_second_are_modified(self):
+        """ A list changing again within the second of its Last-Modified date should only be validated by ETag. """
+        now = int(time.time()) + 10
+        with mock.patch('tweet_monitor.cache.time.time', return_value=now + 0.2):
+            store_statuses(make_statuses(1, first_id=4000, tag="first"))
+            last_modified = self.client.get('/tweets/list_hashtags/')['Last-Modified']
+        with mock.patch('tweet_monitor.cache.time.time', return_value=now + 0.5):
+            store_statuses(make_statuses(1, first_id=5000, tag="new"))
+            response = self.client.get('/tweets/list_hashtags/', HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('Last-Modified'))
+            etag = response['ETag']
+            self.assertEqual(self.client.get('/tweets/list_hashtags/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with mock.patch('tweet_monitor.cache.time.time', return_value=now + 1.2):
+            store_statuses(make_statuses(1, first_id=6000, tag="newer"))
+            response = self.client.get('/tweets/list_hashtags/')
+        self.assertEqual(parse_http_date(last_modified), now)
+        self.assertEqual(parse_http_date(response['Last-Modified']), now + 1)
+
+    def test_pages_have_their_own_etags(self):
+        """ Different pages and formats of the same list shouldn't share validators. """
+        etags = {self.client.get('/tweets/list_hashtags/')['ETag'],
+                 self.client.get('/tweets/list_hashtags/?page_size=1')['ETag'],
+                 self.client.get('/tweets/list_hashtags/?format=api')['ETag']}
+        self.assertEqual(len(etags), 3)
+
+    def test_ingestion_invalidates_the_affected_responses(self):
+        """ Adding tweets should refresh the responses of their owner and hashtags only. """
+        self.client.get('/tweets/filters/user/lucabezerra_/')
+        self.client.get('/tweets/filters/hashtag/test/')
+        self.client.get('/tweets/list_hashtags/')
+        store_statuses(make_statuses(2, owner="someone_else", first_id=5000, tag="other"))
+
+        with self.assertNumQueries(0):
+            self.client.get('/tweets/filters/user/lucabezerra_/')
+        data = self.client.get('/tweets/filters/hashtag/test/').json()
+        self.assertEqual(len(data["results"]), 5)
+        data = self.client.get('/tweets/list_hashtags/').json()
+        self.assertEqual(len(data["results"]), 6)
+
+    def test_saving_a_tweet_invalidates_its_owner(self):
+        """ Tweets saved one by one should also refresh their owner's responses. """
+        self.client.get('/tweets/filters/user/lucabezerra_/')
+        create_tweet()
+
+        data = self.client.get('/tweets/filters/user/lucabezerra_/').json()
+        self.assertEqual(len(data["results"]), 4)
+
+
 class SerializationTests(TestCase):
     def setUp(self):
         create_tweet()
@@ -48,6 +1083,37 @@ class SerializationTests(TestCase):
         serialized = TweetSerializer(tweet)
         self.assertIs(len(serialized.data), 5)
 
+    def test_rows_are_serialized_like_models(self):
+        """ Serializing values() rows should give the same JSON as serializing the model instances. """
+        store_statuses(make_statuses(20))
+        queryset = Tweet.objects.order_by('-creation_date', '-id')
+        serializer = TweetRowSerializer()
+
+        expected = JSONRenderer().render(TweetSerializer(queryset.prefetch_related(
+            Prefetch('hashtags', queryset=Hashtag.objects.order_by('id'))), many=True).data)
+        self.assertEqual(JSONRenderer().render(serializer.to_representation(
+            list(queryset.values(*serializer.get_columns())))), expected)
+
+    def test_fields_can_be_chosen(self):
+        """ The lists should only return the fields asked for, and reject unknown ones. """
+        results = self.client.get('/tweets/filters/?fields=hashtags,provider_id').json()["results"]
+        self.assertEqual(results, [{"provider_id": DEFAULT_TWEET_ID,
+                                    "hashtags": [{"name": "#test"}, {"name": "#tweet"}]}])
+        with self.assertNumQueries(1):
+            self.client.get('/tweets/filters/?fields=provider_id')
+
+        response = self.client.get('/tweets/filters/?fields=provider_id,likes')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Unknown fields: likes", str(response.json()["fields"]))
+
+    def test_serialization_benchmark_runs(self):
+        """ The benchmark should find both serializers giving the same output, and leave the DB as it was. """
+        out = StringIO()
+        call_command('benchmark_serialization', tweets=20, rounds=1, stdout=out)
+
+        self.assertIn("Speedup:", out.getvalue())
+        self.assertEqual(Tweet.objects.count(), 1)
+
 
 class APITests(TestCase):
     def setUp(self):
@@ -56,6 +1122,7 @@ class APITests(TestCase):
         self.user = User.objects.create_user(username='lucabezerra_', email='luca@lol.com', password='pass_word')
         self.client = Client()
         self.client.force_login(self.user, backend='social_core.backends.twitter.TwitterOAuth')
+        cache.clear()
         create_tweet()
 
     def test_user_tweets_are_fetched_and_stored(self):
@@ -79,15 +1146,22 @@ class APITests(TestCase):
     def test_list_tweets_by_username(self):
         """ Should list all tweets stored from a given username. """
         response = self.client.get('/tweets/filters/user/lucabezerra_/')
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 1)
         self.assertEqual(data[0].get("owner"), "lucabezerra_")
 
+    def test_list_tweets_by_username_ignores_case(self):
+        """ Handles are case insensitive, so any casing should list the same tweets. """
+        response = self.client.get('/tweets/filters/user/LucaBezerra_/')
+        data = response.json()["results"]
+
+        self.assertIs(len(data), 1)
+
     def test_list_tweets_by_unknown_username(self):
         """ Should try to find tweets from an unknown username and find none. """
         response = self.client.get('/tweets/filters/user/whatever/')
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 0)
 
@@ -95,7 +1169,7 @@ class APITests(TestCase):
         """ Should list all tweets stored that were tweeted past a given date. """
         date = datetime.now() - timedelta(days=5)
         response = self.client.get('/tweets/filters/date/{}/'.format(date))
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 1)
         self.assertEqual(data[0].get("owner"), "lucabezerra_")
@@ -104,14 +1178,14 @@ class APITests(TestCase):
         """ Should try to list tweets from a future date and find none. """
         date = datetime.now() + timedelta(days=1)
         response = self.client.get('/tweets/filters/date/{}/'.format(date))
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 0)
 
     def test_list_tweets_by_text(self):
         """ Should list all tweets stored that contain a given text. """
         response = self.client.get('/tweets/filters/text/test/')
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 1)
         self.assertEqual(data[0].get("owner"), "lucabezerra_")
@@ -119,7 +1193,7 @@ class APITests(TestCase):
     def test_list_tweets_by_wrong_text(self):
         """ Should try to list tweets that contain a given text and find none. """
         response = self.client.get('/tweets/filters/text/whatever/')
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 0)
 
@@ -128,7 +1202,7 @@ class APITests(TestCase):
         import urllib.parse
         hashtag = urllib.parse.quote_plus("#tweet")  # hash character gets encoded in real requests
         response = self.client.get('/tweets/filters/hashtag/{}/'.format(hashtag))
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 1)
         self.assertEqual(data[0].get("owner"), "lucabezerra_")
@@ -139,7 +1213,7 @@ class APITests(TestCase):
         import urllib.parse
         hashtag = urllib.parse.quote_plus("#whatever")  # hash character gets encoded in real requests
         response = self.client.get('/tweets/filters/hashtag/{}/'.format(hashtag))
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 0)
 
@@ -147,24 +1221,31 @@ class APITests(TestCase):
         """ Should list all tweets stored that contain a given hashtag (NOT including the hash character - #). """
         # hashtags without the hash should also be searched for
         response = self.client.get('/tweets/filters/hashtag/tweet/')
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 1)
         self.assertEqual(data[0].get("owner"), "lucabezerra_")
 
+    def test_list_tweets_by_hashtag_ignores_case(self):
+        """ Hashtags are case insensitive, so any casing should list the same tweets. """
+        response = self.client.get('/tweets/filters/hashtag/TWEET/')
+        data = response.json()["results"]
+
+        self.assertIs(len(data), 1)
+
     def test_list_tweets_by_wrong_hashtag_without_hash_character(self):
         """ Should try to list tweets stored that contain a given hashtag (NOT including the hash character - #)
         and find none. """
         # hashtags without the hash should also be searched for
         response = self.client.get('/tweets/filters/hashtag/whatever/')
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 0)
 
     def test_list_all_stored_hashtags(self):
         """ Should list all hashtags stored in the DB. """
         response = self.client.get('/tweets/list_hashtags/')
-        data = response.json()
+        data = response.json()["results"]
 
         self.assertIs(len(data), 2)
         self.assertEqual(data[0].get("name"), "#test")
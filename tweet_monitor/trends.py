@@ -0,0 +1,163 @@
+from collections import Counter
+import datetime
+import hashlib
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .models import Hashtag, HashtagDailyCount, Tweet, normalize_hashtag
+from .utils import LOOKUP_BATCH_SIZE, chunked
+
+
+TRENDING_DEFAULT_DAYS = 7
+TRENDING_MAX_DAYS = 90
+TRENDING_DEFAULT_LIMIT = 10
+TRENDING_MAX_LIMIT = 100
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+# The suggestions are cached for a while, their ranking doesn't need to follow every ingestion
+AUTOCOMPLETE_CACHE_TIMEOUT = 60
+
+
+def usage_day(creation_date):
+    """
+    Returns the day a tweet counts for, in the site's time zone.
+    :param creation_date: The tweet creation date. Naive ones are taken as UTC, like the Twitter API returns them.
+    :return: A date.
+    """
+    if timezone.is_naive(creation_date):
+        creation_date = timezone.make_aware(creation_date, timezone.utc)
+    return timezone.localtime(creation_date).date()
+
+
+def count_hashtag_uses(uses):
+    """
+    Adds hashtag uses to their daily counts and to the hashtags' total counts. The existing daily counts are
+    read in one query and the counts of each table are updated with one query (per few hundred rows), so
+    the cost doesn't depend on how many tweets there are, nor on how they're spread over the hashtags.
+    :param uses: An iterable of (hashtag ID, tweet creation date) tuples, one per tweet-hashtag link.
+    """
+    counts = Counter((hashtag_id, usage_day(creation_date)) for hashtag_id, creation_date in uses)
+    if not counts:
+        return
+
+    existing = _get_count_ids(counts)
+    missing = [key for key in counts if key not in existing]
+    if missing:
+        _create_counts({key: counts[key] for key in missing})
+
+    _increment_counts(HashtagDailyCount, 'count', {count_id: counts[key] for key, count_id in existing.items()})
+
+    totals = Counter()
+    for (hashtag_id, _), count in counts.items():
+        totals[hashtag_id] += count
+    _increment_counts(Hashtag, 'use_count', totals)
+
+
+def _increment_counts(model, field, increments):
+    """
+    Adds to a count field of many rows, with a single UPDATE whose CASE gives each row its increment.
+    :param model: The model of the rows.
+    :param field: The name of the count field.
+    :param increments: A dict with how much to add to each row, by primary key.
+    """
+    # Each row takes three parameters: its ID in the CASE and in the IN, and its increment
+    for batch in chunked(sorted(increments), LOOKUP_BATCH_SIZE // 3):
+        increment = Case(*[When(id=row_id, then=Value(increments[row_id])) for row_id in batch],
+                         default=Value(0), output_field=IntegerField())
+        model.objects.filter(id__in=batch).update(**{field: F(field) + increment})
+
+
+def _get_count_ids(counts):
+    hashtag_ids = sorted({hashtag_id for hashtag_id, _ in counts})
+    days = [day for _, day in counts]
+
+    count_ids = {}
+    for batch in chunked(hashtag_ids):
+        rows = HashtagDailyCount.objects.filter(hashtag_id__in=batch, day__gte=min(days), day__lte=max(days))
+        count_ids.update(((hashtag_id, day), count_id) for count_id, hashtag_id, day
+                         in rows.values_list('id', 'hashtag_id', 'day') if (hashtag_id, day) in counts)
+    return count_ids
+
+
+def _create_counts(counts):
+    """
+    Inserts new daily counts. If a concurrent ingestion inserted some of them in the meantime, the unique key
+    makes the batch fail, so they're added one by one, incrementing the existing ones.
+    """
+    try:
+        with transaction.atomic():
+            HashtagDailyCount.objects.bulk_create([
+                HashtagDailyCount(hashtag_id=hashtag_id, day=day, count=count)
+                for (hashtag_id, day), count in counts.items()])
+    except IntegrityError:
+        for (hashtag_id, day), count in counts.items():
+            daily_count, created = HashtagDailyCount.objects.get_or_create(
+                hashtag_id=hashtag_id, day=day, defaults={'count': count})
+            if not created:
+                HashtagDailyCount.objects.filter(pk=daily_count.pk).update(count=F('count') + count)
+
+
+def count_added_hashtags(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Signal receiver counting the hashtags linked one by one, since bulk_create doesn't send signals. """
+    if action != 'post_add' or not pk_set:
+        return
+
+    if reverse:
+        creation_dates = Tweet.objects.filter(pk__in=pk_set).values_list('creation_date', flat=True)
+        count_hashtag_uses((instance.pk, creation_date) for creation_date in creation_dates)
+    else:
+        count_hashtag_uses((hashtag_id, instance.creation_date) for hashtag_id in pk_set)
+
+
+def trending_hashtags(days=TRENDING_DEFAULT_DAYS, limit=TRENDING_DEFAULT_LIMIT, today=None):
+    """
+    Returns the most used hashtags over the last days, with their uses over the days before for comparison.
+    Only the daily counts of both windows are read, so the cost doesn't grow with the number of tweets.
+    :param days: The window size, in days, including today.
+    :param limit: The maximum number of hashtags returned.
+    :param today: The last day of the window, today by default.
+    :return: A list of dicts with the hashtag name, count, previous_count and growth, which is the relative
+    change from the previous window or None if the hashtag wasn't used then.
+    """
+    today = today or timezone.localtime(timezone.now()).date()
+    start = today - datetime.timedelta(days=days - 1)
+    previous_start = start - datetime.timedelta(days=days)
+
+    current_uses = Case(When(day__gte=start, then='count'), default=0, output_field=IntegerField())
+    previous_uses = Case(When(day__lt=start, then='count'), default=0, output_field=IntegerField())
+    rows = (HashtagDailyCount.objects.filter(day__gte=previous_start, day__lte=today)
+            .values('hashtag_id', 'hashtag__name')
+            .annotate(current=Sum(current_uses), previous=Sum(previous_uses))
+            .filter(current__gt=0)
+            .order_by('-current', 'hashtag_id')[:limit])
+
+    return [{
+        'name': row['hashtag__name'],
+        'count': row['current'],
+        'previous_count': row['previous'],
+        'growth': (row['current'] - row['previous']) / row['previous'] if row['previous'] else None,
+    } for row in rows]
+
+
+def autocomplete_hashtags(prefix, limit=AUTOCOMPLETE_DEFAULT_LIMIT):
+    """
+    Returns the most used hashtags starting with a prefix. The prefix is matched against the unique index
+    of the hashtag keys (a range scan, with PostgreSQL's pattern ops index too), and the results of each
+    prefix are cached for AUTOCOMPLETE_CACHE_TIMEOUT seconds, so repeated keystrokes don't reach the DB.
+    :param prefix: The beginning of the hashtag, with or without the "#", in any case.
+    :param limit: The maximum number of hashtags returned.
+    :return: A list of dicts with the hashtag name and count, from the most used.
+    """
+    key = normalize_hashtag(prefix)
+    cache_key = 'tweet_monitor:autocomplete:{}:{}'.format(limit, hashlib.sha256(key.encode('utf-8')).hexdigest())
+    suggestions = cache.get(cache_key)
+    if suggestions is None:
+        hashtags = Hashtag.objects.filter(key__startswith=key) if key else Hashtag.objects.all()
+        suggestions = [{'name': name, 'count': count} for name, count
+                       in hashtags.order_by('-use_count', 'id').values_list('name', 'use_count')[:limit]]
+        cache.set(cache_key, suggestions, AUTOCOMPLETE_CACHE_TIMEOUT)
+    return suggestions
@@ -19,13 +19,21 @@ urlpatterns = [
     # url(r'^process_filter/$', views.process_filter, name='process_filter'),
 
     # DRF views
+    url(r'^filters/$', views.FilteredTweetsView.as_view(), name='tweets_filtered'),
     url(r'^filters/user/(?P<username>\S+)/$', views.UserTweetsView.as_view(), name='tweets_by_username'),
+    url(r'^filters/date/$', views.DateRangeTweetsView.as_view(), name='tweets_by_date_range'),
     url(r'^filters/date/(?P<date>.+)/$', views.DateRangeTweetsView.as_view(), name='tweets_by_date'),
-    url(r'^filters/text/(?P<text>\S+)/$', views.TextTweetsView.as_view(), name='tweets_by_text'),
+    url(r'^filters/text/(?P<text>.+)/$', views.TextTweetsView.as_view(), name='tweets_by_text'),
     url(r'^filters/hashtag/(?P<hashtag>\S+)/$', views.HashtagTweetsView.as_view(), name='tweets_by_hashtag'),
     url(r'^list_hashtags/$', views.HashtagsView.as_view(), name='hashtags_list'),
+    url(r'^trending_hashtags/$', views.TrendingHashtagsView.as_view(), name='trending_hashtags'),
+    url(r'^hashtags/autocomplete/$', views.HashtagAutocompleteView.as_view(), name='hashtags_autocomplete'),
+    url(r'^histogram/$', views.TweetHistogramView.as_view(), name='tweets_histogram'),
+    url(r'^export/$', views.ExportTweetsView.as_view(), name='tweets_export'),
 
     url(r'^fetch/$', views.FetchTweetsView.as_view(), name='fetch_tweets'),
+    url(r'^fetch/(?P<pk>[0-9a-f-]+)/$', views.FetchJobView.as_view(), name='fetch_job'),
+    url(r'^fetch/batch/(?P<pk>[0-9a-f-]+)/$', views.FetchBatchView.as_view(), name='fetch_batch'),
 
     url(r'^.*/', TemplateView.as_view(template_name="tweet_monitor/react_index.html"), name='react_base'),
 ]
@@ -0,0 +1,13 @@
+# Keeps `IN (...)` lookups below SQLite's 999 bound parameters limit.
+LOOKUP_BATCH_SIZE = 500
+
+
+def chunked(items, size=LOOKUP_BATCH_SIZE):
+    """
+    Splits a list into consecutive slices of at most `size` elements.
+    :param items: The list to be split.
+    :param size: The maximum length of each slice.
+    :return: A generator of lists.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -1,150 +1,340 @@
-from django.conf import settings
+from collections import Counter, OrderedDict
+import json
+import re
+import uuid
+
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.views.generic import View
 
-from rest_framework import generics
+from celery import group
+from rest_framework import generics, status
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from social_django.models import UserSocialAuth
-import tweepy
-from tweepy import TweepError
 
-from .models import Tweet, Hashtag
-from .serializers import TweetSerializer, HashtagSerializer
+from .cache import HASHTAG_LIST_SCOPE, CachedListMixin, hashtag_scope, owner_scope
+from .export import EXPORT_FORMATS, iter_tweet_rows
+from .filters import filter_tweets, get_tweet_filters, parse_fields_param, parse_int_param, planned_filter_tweets
+from .histogram import get_histogram_range, tweet_histogram
+from .metrics import celery_queue_lengths, render_metrics
+from .models import FetchJob, Hashtag, Tweet, normalize_handle, normalize_hashtag
+from .pagination import HashtagPagination, SearchResultsPagination, TweetPagination
+from .search import search_tweets
+from .serializers import (FetchJobSerializer, HashtagSerializer, HashtagSuggestionSerializer, HistogramBucketSerializer,
+                          TrendingHashtagSerializer, TweetRowSerializer, TweetSerializer)
+from .tasks import fetch_handle_tweets
+from .trends import (AUTOCOMPLETE_DEFAULT_LIMIT, AUTOCOMPLETE_MAX_LIMIT, TRENDING_DEFAULT_DAYS, TRENDING_DEFAULT_LIMIT,
+                     TRENDING_MAX_DAYS, TRENDING_MAX_LIMIT, autocomplete_hashtags, trending_hashtags)
 
 
 # ########### Retrieval Endpoints ########### #
 
 
-class TweetsView(generics.ListAPIView):
-    """ Returns a list of all tweets. """
+class TweetListView(generics.ListAPIView):
+    """
+    Base view for the lists of tweets. The tweets of a page are read with values() and their hashtags in a
+    single query, then serialized by TweetRowSerializer, so no model instances are built. The `fields`
+    parameter (e.g. ?fields=provider_id,creation_date) limits the fields returned.
+    """
     model = Tweet
     serializer_class = TweetSerializer
+    pagination_class = TweetPagination
+
+    def get_row_serializer(self):
+        return TweetRowSerializer(parse_fields_param(self.request.query_params, TweetRowSerializer.fields))
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_row_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = getattr(self.paginator, 'ordering', ())
+        rows = self.paginate_queryset(queryset.values(*serializer.get_columns(ordering)))
+        if rows is None:
+            return Response(serializer.to_representation(list(queryset.values(*serializer.get_columns()))))
+        return self.get_paginated_response(serializer.to_representation(rows))
+
+
+class TweetsView(TweetListView):
+    """ Returns a list of all tweets. """
 
     def get_queryset(self):
         return Tweet.objects.all()
 
 
-class UserTweetsView(generics.ListAPIView):
+class FilteredTweetsView(TweetListView):
+    """
+    Returns a list of the tweets matching every given filter (user, hashtag, start, end and text), applying
+    the most selective one first.
+    """
+
+    def get_queryset(self):
+        return planned_filter_tweets(Tweet.objects.all(), get_tweet_filters(self.request.query_params))
+
+
+class UserTweetsView(CachedListMixin, TweetListView):
     """ Returns a list of all tweets from a specific user. """
-    model = Tweet
-    serializer_class = TweetSerializer
+
+    def get_cache_scope(self):
+        return owner_scope(normalize_handle(self.kwargs.get('username')))
 
     def get_queryset(self):
         if self.kwargs.get('username'):
-            return Tweet.objects.filter(owner__iexact=self.kwargs.get('username'))
+            return Tweet.objects.filter(owner_key=normalize_handle(self.kwargs.get('username')))
 
 
-class DateRangeTweetsView(generics.ListAPIView):
-    """ Returns a list of all tweets in a specific date range. """
-    model = Tweet
-    serializer_class = TweetSerializer
+class DateRangeTweetsView(TweetListView):
+    """
+    Returns a list of the tweets created between the `start` and `end` parameters (dates or datetimes, both
+    optional). The start can also be given in the URL, which is kept for compatibility.
+    """
 
     def get_queryset(self):
-        if self.kwargs.get('date'):
-            return Tweet.objects.filter(creation_date__gte=self.kwargs.get('date'))
+        filters = get_tweet_filters({'start': self.kwargs.get('date') or self.request.query_params.get('start', ''),
+                                     'end': self.request.query_params.get('end', '')})
+        return filter_tweets(Tweet.objects.all(), **filters)
 
 
-class TextTweetsView(generics.ListAPIView):
-    """ Returns a list of all tweets containing a specific text. """
-    model = Tweet
-    serializer_class = TweetSerializer
+class TweetHistogramView(APIView):
+    """
+    Returns the number of tweets per `interval` (hour, day or week) between `start` and `end`, optionally
+    filtered by the same parameters as the export.
+    """
 
-    def get_queryset(self):
-        if self.kwargs.get('text'):
-            return Tweet.objects.filter(text__icontains=self.kwargs.get('text'))
+    def get(self, request):
+        filters = get_tweet_filters(request.query_params)
+        interval = request.query_params.get('interval', 'day')
+        start, end = get_histogram_range(interval, filters.get('start'), filters.get('end'))
+        filters.update(start=start, end=end)
 
+        buckets = tweet_histogram(filter_tweets(Tweet.objects.all(), **filters), interval, start, end)
+        return Response(HistogramBucketSerializer(buckets, many=True).data)
 
-class HashtagsView(generics.ListAPIView):
+
+class TextTweetsView(TweetListView):
+    """ Returns a list of the tweets containing every word of a specific text, from the most relevant. """
+    pagination_class = SearchResultsPagination
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_row_serializer()
+        results = self.paginate_queryset(search_tweets(self.kwargs.get('text')))
+        rows = self.filter_queryset(Tweet.objects.filter(id__in=[result['id'] for result in results]))
+        tweets = {row['id']: row for row in rows.values(*serializer.get_columns())}
+
+        return self.get_paginated_response(serializer.to_representation(
+            [tweets[result['id']] for result in results if result['id'] in tweets]))
+
+
+class HashtagsView(CachedListMixin, generics.ListAPIView):
     """ Returns a list of all hashtags. """
     model = Hashtag
     serializer_class = HashtagSerializer
+    pagination_class = HashtagPagination
+
+    def get_cache_scope(self):
+        return HASHTAG_LIST_SCOPE
 
     def get_queryset(self):
         return Hashtag.objects.all()
 
 
-class HashtagTweetsView(generics.ListAPIView):
+class TrendingHashtagsView(APIView):
+    """ Returns the most used hashtags over the last `days` days, with their growth from the days before. """
+
+    def get(self, request):
+        days = parse_int_param(request.query_params, 'days', TRENDING_DEFAULT_DAYS, TRENDING_MAX_DAYS)
+        limit = parse_int_param(request.query_params, 'limit', TRENDING_DEFAULT_LIMIT, TRENDING_MAX_LIMIT)
+
+        serializer = TrendingHashtagSerializer(trending_hashtags(days=days, limit=limit), many=True)
+        return Response(serializer.data)
+
+
+class HashtagAutocompleteView(APIView):
+    """ Returns the most used hashtags starting with the `q` parameter, for autocompletion. """
+
+    def get(self, request):
+        limit = parse_int_param(request.query_params, 'limit', AUTOCOMPLETE_DEFAULT_LIMIT, AUTOCOMPLETE_MAX_LIMIT)
+
+        serializer = HashtagSuggestionSerializer(autocomplete_hashtags(request.query_params.get('q', ''), limit),
+                                                 many=True)
+        return Response(serializer.data)
+
+
+class HashtagTweetsView(CachedListMixin, TweetListView):
     """ Returns a list of all tweets containing a specific hashtag. """
-    model = Tweet
-    serializer_class = TweetSerializer
+
+    def get_cache_scope(self):
+        return hashtag_scope(normalize_hashtag(self.kwargs.get('hashtag')))
 
     def get_queryset(self):
         hashtag = self.kwargs.get('hashtag')
         if hashtag:
-            hashtag = "#" + hashtag if hashtag[0] != "#" else hashtag
-            return Tweet.objects.filter(Q(hashtags__name__iexact=hashtag))
+            return Tweet.objects.filter(hashtags__key=normalize_hashtag(hashtag))
+
+
+class ExportTweetsView(View):
+    """
+    Streams the tweets matching the user, start, end, text and hashtag parameters as NDJSON (the default)
+    or CSV, according to the format parameter. The rows are read and sent in chunks, so memory use doesn't
+    depend on the size of the export.
+    """
+
+    def get(self, request):
+        export_format = request.GET.get('format', 'ndjson')
+        try:
+            if export_format not in EXPORT_FORMATS:
+                raise ValidationError({'format': "Invalid format, use one of: {}.".format(
+                    ', '.join(sorted(EXPORT_FORMATS)))})
+            filters = get_tweet_filters(request.GET)
+        except ValidationError as err:
+            return HttpResponseBadRequest(json.dumps(err.detail), content_type='application/json')
+
+        render_rows, content_type = EXPORT_FORMATS[export_format]
+        rows = iter_tweet_rows(filter_tweets(Tweet.objects.all(), **filters))
+        response = StreamingHttpResponse(render_rows(rows), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="tweets.{}"'.format(export_format)
+        return response
 
 
 # ########### Creation Endpoints ########### #
+
+# The most handles a bulk fetch accepts
+MAX_BATCH_HANDLES = 1000
+
+
 class FetchTweetsView(APIView):
-    """ Fetches 200 most recent tweets from a specific user and stores them in the DB. """
+    """
+    Schedules the fetch of the tweets from a specific user, returning the job to be polled. The optional `mode`
+    can be "backfill", to walk back the timeline to the API's history limit, or "refresh", to only get the
+    tweets newer than the stored ones.
+    A list of `usernames` (or a single string separated by commas or spaces) can be given instead, in which
+    case their fetches run in parallel and the batch is returned, with the outcome of each handle.
+    """
 
     def post(self, request):
         username = request.data.get('username')
-        if username:
-            response = _add_handle(request.data.get("user_id"), username)
-        else:
-            response = "Please provide a Twitter handle to have its tweets fetched."
+        handles = _get_handles(request.data)
+        if not username and not handles:
+            return Response("Please provide a Twitter handle to have its tweets fetched.")
 
-        return Response(response)
+        mode = request.data.get('mode', '')
+        if mode and mode not in dict(FetchJob.MODE_CHOICES):
+            return Response("The fetch mode must be either 'backfill' or 'refresh'.",
+                            status=status.HTTP_400_BAD_REQUEST)
 
+        if handles:
+            if len(handles) > MAX_BATCH_HANDLES:
+                return Response("Please provide at most {} handles at once.".format(MAX_BATCH_HANDLES),
+                                status=status.HTTP_400_BAD_REQUEST)
+            batch_id, jobs = _schedule_batch(request.data.get("user_id"), handles, mode)
+            return Response(_batch_data(batch_id, jobs), status=status.HTTP_202_ACCEPTED,
+                            headers={'Location': reverse("tweet_monitor:fetch_batch", args=[batch_id])})
 
-def _add_handle(user_id, handle):
+        job = _schedule_fetch(request.data.get("user_id"), username, mode)
+        return Response(FetchJobSerializer(job).data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': reverse("tweet_monitor:fetch_job", args=[job.pk])})
 
-    found = Tweet.objects.filter(owner__iexact=handle)
-    if found:
-        return_message = "The handle {} was already added to the database!".format(handle)
-    else:
-        user_obj = UserSocialAuth.objects.get(user_id=user_id)
-        tweepy_handler = generate_tweepy_handler(user_obj.extra_data['access_token']['oauth_token'],
-                                                 user_obj.extra_data['access_token']['oauth_token_secret'])
 
+class FetchJobView(generics.RetrieveAPIView):
+    """ Returns the current status of a fetch job. """
+    model = FetchJob
+    serializer_class = FetchJobSerializer
+    queryset = FetchJob.objects.all()
+
+
+class FetchBatchView(APIView):
+    """ Returns the current status and outcome of each fetch of a batch, with their counts. """
+
+    def get(self, request, pk):
         try:
-            statuses = tweepy_handler.user_timeline(screen_name=handle, count=200)
-            tweets_list = []
+            batch_id = uuid.UUID(pk)
+        except ValueError:
+            raise NotFound()
+        jobs = list(FetchJob.objects.filter(batch_id=batch_id).order_by('handle'))
+        if not jobs:
+            raise NotFound()
+        return Response(_batch_data(batch_id, jobs))
 
-            for status in statuses:
-                tweet = Tweet(provider_id=status.id, owner=status.user.screen_name, text=status.text,
-                              creation_date=status.created_at)
-                tweets_list.append(tweet)
 
-            Tweet.objects.bulk_create(tweets_list)
+def _get_handles(data):
+    """
+    Reads the list of handles of a bulk fetch, dropping the repeated ones.
+    :param data: The request data, with the `usernames` list or string.
+    :return: A list of handles.
+    """
+    usernames = data.getlist('usernames') if hasattr(data, 'getlist') else data.get('usernames')
+    if isinstance(usernames, str):
+        usernames = [usernames]
+
+    handles = OrderedDict()
+    for value in usernames or []:
+        for handle in re.split(r'[\s,]+', str(value)):
+            if handle.strip().lstrip('@'):
+                handles.setdefault(normalize_handle(handle), handle.strip().lstrip('@'))
+    return list(handles.values())
 
-            saved_tweets = Tweet.objects.filter(owner__iexact=handle)
-            for t in saved_tweets:
-                t.extract_hashtags()
 
-            return_message = "The handle {} was added!".format(handle)
-        except TweepError as err:
-            if err.response.status_code == 404:
-                return_message = "The provided Twitter handle doesn't exist. Please check the spelling."
-            else:
-                return_message = "There was a problem in the request, please check the handle spelling and try again."
+def _schedule_batch(user_id, handles, mode=''):
+    """
+    Creates the FetchJobs of a batch with a single insert and sends them to the Celery workers as a group,
+    once the current transaction commits, so they run in parallel. Each fetch then stores its handle's tweets
+    with a few batched inserts per page of the timeline (see store_statuses). The tweets of different handles
+    aren't merged into the same inserts: they're fetched by different workers, and a handle's pages are
+    stored as they come, so an interrupted fetch keeps what it got and resumes from there.
+    :param user_id: The ID of the user whose Twitter credentials will be used.
+    :param handles: The Twitter handles.
+    :param mode: One of FetchJob.MODE_CHOICES, or empty to let each handle's state decide.
+    :return: A tuple with the batch ID and the FetchJobs.
+    """
+    batch_id = uuid.uuid4()
+    jobs = [FetchJob(user_id=user_id, handle=handle, mode=mode, batch_id=batch_id) for handle in handles]
+    FetchJob.objects.bulk_create(jobs)
+    transaction.on_commit(lambda: group(fetch_handle_tweets.s(str(job.pk)) for job in jobs).apply_async())
+    return batch_id, jobs
+
 
-    return return_message
+def _batch_data(batch_id, jobs):
+    """ Serializes a batch, counting its jobs by outcome, or by status while they don't have one. """
+    summary = Counter(job.outcome or job.status for job in jobs)
+    return OrderedDict([
+        ('batch_id', str(batch_id)),
+        ('summary', OrderedDict(sorted(summary.items()))),
+        ('jobs', FetchJobSerializer(jobs, many=True).data),
+    ])
 
 
-def generate_tweepy_handler(user_access_token, user_access_token_secret):
+def _schedule_fetch(user_id, handle, mode=''):
     """
-    Generate handler object to use Tweepy's methods.
-    :param user_access_token: The access token obtained from the signin process.
-    :param user_access_token_secret: The access token secret.
-    :return: The API handler.
+    Creates a FetchJob and sends it to the Celery workers once the current transaction commits.
+    :param user_id: The ID of the user whose Twitter credentials will be used.
+    :param handle: The Twitter handle.
+    :param mode: One of FetchJob.MODE_CHOICES, or empty to let the handle's state decide.
+    :return: The FetchJob.
     """
-    consumer_key = settings.SOCIAL_AUTH_TWITTER_KEY
-    consumer_secret = settings.SOCIAL_AUTH_TWITTER_SECRET
-    access_key = user_access_token
-    access_secret = user_access_token_secret
-    auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
-    auth.set_access_token(access_key, access_secret)
-    handler = tweepy.API(auth)
+    job = FetchJob.objects.create(user_id=user_id, handle=handle, mode=mode)
+    transaction.on_commit(lambda: fetch_handle_tweets.delay(str(job.pk)))
+    return job
+
 
-    return handler
+def metrics(request):
+    """
+    Exports the ingestion metrics in the Prometheus text format, with the current queue depths: the tasks
+    waiting in the Celery queues and the fetch jobs in progress.
+    """
+    job_counts = dict(FetchJob.objects.filter(status__in=[FetchJob.STATUS_PENDING, FetchJob.STATUS_RUNNING])
+                      .order_by().values_list('status').annotate(count=Count('id')))
+    gauges = [
+        ('tweet_monitor_celery_queue_length', "Tasks waiting in each Celery queue.",
+         [((('queue', queue),), length) for queue, length in sorted(celery_queue_lengths().items())]),
+        ('tweet_monitor_fetch_jobs', "Fetch jobs in progress, by status.",
+         [((('status', job_status),), job_counts.get(job_status, 0))
+          for job_status in (FetchJob.STATUS_PENDING, FetchJob.STATUS_RUNNING)]),
+    ]
+    return HttpResponse(render_metrics(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @login_required
@@ -163,7 +353,7 @@ def index(request):
 @login_required
 def add_handle(request):
     """
-    Gets the user inserted Twitter handle and fetches his/her 200 more recent tweets, storing them in the DB.
+    Gets the user inserted Twitter handle and schedules the fetch of his/her more recent tweets.
     :param request: The HTTP request.
     :return: Redirects back to index view with the result message.
     """
@@ -171,40 +361,9 @@ def add_handle(request):
         handle = request.POST.get("handleName")
 
         if handle:
-            found = Tweet.objects.filter(owner__iexact=handle)
-            if found:
-                messages.warning(request, "{}' tweets were already in the database!".format(handle))
-            else:
-                user_obj = UserSocialAuth.objects.get(user_id=request.user.id)
-                tweepy_handler = generate_tweepy_handler(user_obj.extra_data['access_token']['oauth_token'],
-                                                         user_obj.extra_data['access_token']['oauth_token_secret'])
-
-                try:
-                    statuses = tweepy_handler.user_timeline(screen_name=handle, count=200)
-                    tweets_list = []
-
-                    for status in statuses:
-                        tweet = Tweet(provider_id=status.id, owner=status.user.screen_name, text=status.text,
-                                      creation_date=status.created_at)
-                        tweets_list.append(tweet)
-
-                    Tweet.objects.bulk_create(tweets_list)
-
-                    saved_tweets = Tweet.objects.filter(owner__iexact=handle)
-                    for t in saved_tweets:
-                        t.extract_hashtags()
-
-                    messages.success(request, "@{}'s tweets were added successfully!".format(handle))
-                except TweepError as err:
-                    print(":::: ERROR:", err, err.response.status_code)
-                    if err.response.status_code == 404:
-                        messages.error(request, "The provided Twitter handle doesn't exist. Please check the spelling.")
-                    elif err.response.status_code == 401:
-                        messages.error(request, "{}'s timeline is protected, we can't fetch his/her "
-                                                "tweets.".format(handle))
-                    else:
-                        messages.error(request, "There was a problem in the request, please check the handle spelling "
-                                                "and try again.")
+            _schedule_fetch(request.user.id, handle)
+            messages.info(request, "@{}'s tweets are being fetched, they'll be available in a few "
+                                   "moments.".format(handle))
         else:
             messages.error(request, "Please provide a Twitter handle to have its tweets fetched.")
     else:
@@ -217,8 +376,7 @@ def add_handle(request):
 
 @login_required
 def filters(request):
-    hashtags = Hashtag.objects.all()
-    return render(request, "tweet_monitor/filters.html", {"name": request.user.first_name, "hashtags": hashtags})
+    return render(request, "tweet_monitor/filters.html", {"name": request.user.first_name})
 
 
 @login_required
@@ -226,7 +384,7 @@ def process_filter(request):
     if request.POST:
         if request.POST.get("userFilter"):
             print("User:", request.POST.get("userFilter"))
-            tweets = Tweet.objects.filter(owner__iexact=request.POST.get("userFilter"))
+            tweets = Tweet.objects.filter(owner_key=normalize_handle(request.POST.get("userFilter")))
         elif request.POST.get("dateFilter"):
             print("Date:", request.POST.get("dateFilter"))
         elif request.POST.get("textFilter"):
@@ -234,11 +392,9 @@ def process_filter(request):
             tweets = Tweet.objects.filter(text__icontains=request.POST.get("textFilter"))
         elif request.POST.get("hashtagFilter"):
             print("Hashtag:", request.POST.get("hashtagFilter"))
-            tweets = Tweet.objects.filter(Q(hashtags__name__iexact=request.POST.get("hashtagFilter")))
+            tweets = Tweet.objects.filter(hashtags__key=normalize_hashtag(request.POST.get("hashtagFilter")))
             print("Tweets found:", tweets)
     else:
         messages.error(request, "There was a problem in the request, please try again.")
 
-    hashtags = Hashtag.objects.all()
-    return render(request, "tweet_monitor/filters.html", {"name": request.user.first_name, "hashtags": hashtags,
-                                                          "tweets": tweets})
+    return render(request, "tweet_monitor/filters.html", {"name": request.user.first_name, "tweets": tweets})